@@ -0,0 +1,89 @@
+"""
+Compare the allocation cost of carrying export rows through parsing and
+transformation as dicts keyed by column (dict(zip(header, row)), as
+sync_export used to) against tuples of values (export_rows). Both are
+transformed with transform_values_batch.
+
+    python benchmarks/bench_memory.py [--rows N] [--entity users]
+
+Each pipeline is run twice over the same synthetic export: once under
+tracemalloc for the peak of traced memory, and once untraced for throughput
+and the number of generation 0 garbage collections, which grows with the
+number of container objects allocated.
+"""
+
+import argparse
+import csv
+import gc
+import time
+import tracemalloc
+from unittest.mock import patch
+
+import tap_referral_saasquatch
+from synthetic import synthetic_csv
+from tap_referral_saasquatch import TRANSFORM_BATCH_SIZE, batched, export_rows
+from tap_referral_saasquatch.client import open_text
+from tap_referral_saasquatch.transform import compile_transformer
+
+
+def dict_rows():
+    linereader = csv.reader(open_text(tap_referral_saasquatch.export_chunks("bench")))
+    header = next(linereader)
+    for row in linereader:
+        yield dict(zip(header, row))
+
+
+def dict_pipeline(entity, transformer):
+    count = 0
+    for batch in batched(dict_rows(), TRANSFORM_BATCH_SIZE):
+        names = list(batch[0])
+        count += len(transformer.transform_values_batch(names, [list(row.values()) for row in batch]))
+    return count
+
+
+def tuple_pipeline(entity, transformer):
+    names, rows = export_rows(entity, "bench")
+    count = 0
+    for batch in batched(rows, TRANSFORM_BATCH_SIZE):
+        count += len(transformer.transform_values_batch(names, batch))
+    return count
+
+
+def bench(label, pipeline, entity, transformer):
+    tracemalloc.start()
+    pipeline(entity, transformer)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    collections = gc.get_stats()[0]["collections"]
+    started = time.perf_counter()
+    count = pipeline(entity, transformer)
+    elapsed = time.perf_counter() - started
+    collections = gc.get_stats()[0]["collections"] - collections
+
+    print("{:<8} {:>10.0f} records/sec  peak {:>7.2f} MiB  {:>6} gen0 collections"
+          .format(label, count / elapsed, peak / 1024 / 1024, collections))
+    return elapsed, peak, collections
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--entity", default="users",
+                        choices=["users", "referrals", "reward_balances"])
+    args = parser.parse_args()
+
+    data = synthetic_csv(args.entity, args.rows)
+    schema = tap_referral_saasquatch.load_schema(args.entity)
+    transformer = compile_transformer(args.entity, schema, {})
+
+    with patch.object(tap_referral_saasquatch, "export_chunks", side_effect=lambda export_id: iter([data])):
+        baseline = bench("dicts", dict_pipeline, args.entity, transformer)
+        optimized = bench("tuples", tuple_pipeline, args.entity, transformer)
+
+    print("speedup: {:.2f}x, gen0 collections: {:.2f}x fewer"
+          .format(baseline[0] / optimized[0], baseline[2] / max(optimized[2], 1)))
+
+
+if __name__ == "__main__":
+    main()
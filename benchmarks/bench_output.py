@@ -0,0 +1,52 @@
+"""
+Compare singer.write_record, which serializes and flushes stdout once per
+record, against the buffered RecordWriter used by sync_export.
+
+    python benchmarks/bench_output.py [--rows N] [--entity users] > /dev/null
+
+Results are printed to stderr so stdout can be pointed at /dev/null or a
+pipe into a target.
+"""
+
+import argparse
+import sys
+import time
+
+import singer
+
+from synthetic import synthetic_rows
+from tap_referral_saasquatch.output import RecordWriter
+
+
+def bench(label, write, flush, records):
+    started = time.perf_counter()
+    for record in records:
+        write(record)
+    flush()
+    elapsed = time.perf_counter() - started
+    print("{:<20} {:>10.0f} records/sec ({:.2f}s)".format(label, len(records) / elapsed, elapsed),
+          file=sys.stderr)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--entity", default="users",
+                        choices=["users", "referrals", "reward_balances"])
+    args = parser.parse_args()
+
+    records = list(synthetic_rows(args.entity, args.rows))
+    writer = RecordWriter()
+
+    baseline = bench("singer.write_record",
+                     lambda record: singer.write_record(args.entity, record),
+                     lambda: None, records)
+    optimized = bench("RecordWriter",
+                      lambda record: writer.write_record(args.entity, record),
+                      writer.flush, records)
+    print("speedup: {:.1f}x".format(baseline / optimized), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
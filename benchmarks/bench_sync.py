@@ -0,0 +1,110 @@
+"""
+Measure an end-to-end sync against the local export stand-in in
+export_server.py: records/sec, time to the first RECORD message and the
+peak RSS of the tap process.
+
+    python benchmarks/bench_sync.py [--rows N] [--streams users referrals]
+                                    [--config '{"max_concurrent_exports": 3}']
+
+The tap is run as a separate process with --config and --catalog, exactly as
+a scheduler would run it, with every requested stream selected. Its stdout
+is read here and its stderr is discarded unless --verbose is given.
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from singer import metadata
+
+from export_server import ExportServer
+from tap_referral_saasquatch.discover import discover
+
+TAP_COMMAND = "import tap_referral_saasquatch; tap_referral_saasquatch.main()"
+
+
+def write_catalog(path, streams):
+    catalog = discover()
+    for stream in catalog.streams:
+        mdata = metadata.to_map(stream.metadata)
+        mdata = metadata.write(mdata, (), "selected", stream.tap_stream_id in streams)
+        stream.metadata = metadata.to_list(mdata)
+    with open(path, "w") as f:
+        json.dump(catalog.to_dict(), f)
+
+
+def run_tap(config_path, catalog_path, verbose):
+    started = time.perf_counter()
+    first_record = None
+    counts = {}
+    proc = subprocess.Popen([sys.executable, "-c", TAP_COMMAND,
+                             "--config", config_path, "--catalog", catalog_path],
+                            stdout=subprocess.PIPE,
+                            stderr=None if verbose else subprocess.DEVNULL)
+    for line in proc.stdout:
+        if line.startswith(b'{"type": "RECORD"'):
+            if first_record is None:
+                first_record = time.perf_counter() - started
+            stream = json.loads(line)["stream"]
+            counts[stream] = counts.get(stream, 0) + 1
+    returncode = proc.wait()
+    elapsed = time.perf_counter() - started
+    if returncode:
+        sys.exit("tap exited with status {}".format(returncode))
+    return counts, elapsed, first_record
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100000, help="rows per export")
+    parser.add_argument("--streams", nargs="+", default=["users", "referrals", "reward_balances"],
+                        choices=["users", "referrals", "reward_balances"])
+    parser.add_argument("--empty-ratio", type=float, default=0.1)
+    parser.add_argument("--multiline-ratio", type=float, default=0.0)
+    parser.add_argument("--ready-after", type=int, default=0,
+                        help="status polls answered PENDING before an export completes")
+    parser.add_argument("--no-compression", action="store_true",
+                        help="serve downloads without gzip Content-Encoding")
+    parser.add_argument("--config", default="{}", help="extra tap config as JSON")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    server = ExportServer(("127.0.0.1", 0), rows=args.rows, empty_ratio=args.empty_ratio,
+                          multiline_ratio=args.multiline_ratio, ready_after=args.ready_after,
+                          compress=not args.no_compression)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    # Generate the CSVs up front so the tap does not wait on them
+    for entity in args.streams:
+        server.compressed_body(server.create_export(entity))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        config_path = os.path.join(tmp, "config.json")
+        catalog_path = os.path.join(tmp, "catalog.json")
+        config = {"api_key": "bench", "tenant_alias": "bench", "start_date": "2017-01-01T00:00:00Z",
+                  "base_url": server.base_url}
+        config.update(json.loads(args.config))
+        with open(config_path, "w") as f:
+            json.dump(config, f)
+        write_catalog(catalog_path, args.streams)
+
+        counts, elapsed, first_record = run_tap(config_path, catalog_path, args.verbose)
+
+    server.shutdown()
+    records = sum(counts.values())
+    peak_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    for stream, count in sorted(counts.items()):
+        print("{:<16} {:>10} records".format(stream, count))
+    print("{:<16} {:>10.0f} records/sec ({} records in {:.2f}s)"
+          .format("throughput", records / elapsed, records, elapsed))
+    print("{:<16} {:>10.3f} s".format("first record", first_record or 0))
+    print("{:<16} {:>10.1f} MiB".format("peak RSS", peak_rss))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Compare records/sec of singer.Transformer against the per-stream
+CompiledTransformer used by sync_export, in batches with column-wise
+timestamp conversion, plus transform_timestamp against transform_timestamps
+on the stream's date columns.
+
+    python benchmarks/bench_transform.py [--rows N] [--entity referrals]
+
+The singer.Transformer path is fed rows that went through transform_row first
+so both paths see epoch-millisecond dates converted and produce identical
+records.
+"""
+
+import argparse
+import time
+
+import singer
+from singer import metadata
+
+from synthetic import synthetic_rows
+from tap_referral_saasquatch import transform
+from tap_referral_saasquatch.discover import discover
+from tap_referral_saasquatch.transform import (TRANSFORMS, compile_transformer, transform_row,
+                                               transform_timestamp, transform_timestamps)
+
+BATCH_SIZE = 1000
+
+
+def bench(label, func, items, count, unit="records"):
+    started = time.perf_counter()
+    for item in items:
+        func(item)
+    elapsed = time.perf_counter() - started
+    print("{:<20} {:>10.0f} {}/sec ({:.2f}s)".format(label, count / elapsed, unit, elapsed))
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--entity", default="referrals",
+                        choices=["users", "referrals", "reward_balances"])
+    args = parser.parse_args()
+
+    catalog_stream = discover().get_stream(args.entity)
+    mdata = metadata.to_map(catalog_stream.metadata)
+    rows = list(synthetic_rows(args.entity, args.rows))
+
+    compiled = compile_transformer(args.entity, catalog_stream.schema.to_dict(), mdata)
+    singer_transformer = singer.Transformer()
+
+    def singer_path(row):
+        return singer_transformer.transform(transform_row(args.entity, row),
+                                            catalog_stream.schema.to_dict(), mdata)
+
+    names = list(rows[0])
+    values = [tuple(row.values()) for row in rows]
+    for row, row_values in zip(rows[:1000], values):
+        assert singer_path(dict(row)) == compiled.transform_values_batch(names, [row_values])[0]
+
+    print("{} rows of {}".format(len(rows), args.entity))
+    baseline = bench("singer.Transformer", singer_path, [dict(row) for row in rows], len(rows))
+    batches = [values[i:i + BATCH_SIZE] for i in range(0, len(values), BATCH_SIZE)]
+    optimized = bench("compiled", lambda batch: compiled.transform_values_batch(names, batch),
+                      batches, len(rows))
+    print("speedup: {:.1f}x".format(baseline / optimized))
+
+    timestamp_fields = [field for field, converter in TRANSFORMS[args.entity].items()
+                        if converter is transform_timestamp]
+    if not timestamp_fields:
+        return
+
+    values = [row[field] for row in rows for field in timestamp_fields]
+    print("{} timestamps".format(len(values)))
+    baseline = bench("transform_timestamp", transform_timestamp, values, len(values), "values")
+    numpy = transform.numpy
+    try:
+        transform.numpy = None
+        optimized = bench("cached formatter", transform_timestamps, [values], len(values), "values")
+        print("speedup: {:.1f}x".format(baseline / optimized))
+    finally:
+        transform.numpy = numpy
+    if numpy is not None:
+        optimized = bench("numpy", transform_timestamps, [values], len(values), "values")
+        print("speedup: {:.1f}x".format(baseline / optimized))
+
+
+if __name__ == "__main__":
+    main()
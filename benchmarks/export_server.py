@@ -0,0 +1,164 @@
+"""
+Local stand-in for the SaaSquatch export API, serving synthetic CSV exports
+for benchmarks.
+
+    POST /api/v1/{tenant}/export                 create an export
+    GET  /api/v1/{tenant}/export/{id}            export status
+    GET  /api/v1/{tenant}/export/{id}/download   CSV body, honouring Range and
+                                                 gzip Accept-Encoding
+
+Point the tap at it with the base_url config key, for example
+"http://127.0.0.1:8080/api/v1/{}". It can also be run on its own:
+
+    python benchmarks/export_server.py [--port 8080] [--rows N]
+"""
+
+import argparse
+import gzip
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from synthetic import synthetic_csv
+
+EXPORT_TYPES = {
+    "USER": "users",
+    "REFERRAL": "referrals",
+    "REWARD_BALANCE": "reward_balances",
+}
+EXPORT_PATH = re.compile(r"^/api/v1/[^/]+/export(?:/([^/]+)(/download)?)?$")
+
+
+class ExportServer(ThreadingHTTPServer):
+    """
+    Serves one synthetic CSV per export type, generated on first use. Each
+    export reports PENDING for ready_after status polls before COMPLETED.
+    Unless compress is False, whole-body downloads that accept gzip are sent
+    gzip-encoded
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, rows=10000, empty_ratio=0.1, multiline_ratio=0.0, ready_after=0,
+                 compress=True):
+        super().__init__(address, ExportHandler)
+        self.rows = rows
+        self.empty_ratio = empty_ratio
+        self.multiline_ratio = multiline_ratio
+        self.ready_after = ready_after
+        self.compress = compress
+        self.lock = threading.Lock()
+        self.exports = {}
+        self.bodies = {}
+        self.compressed_bodies = {}
+
+    @property
+    def base_url(self):
+        return "http://{}:{}/api/v1/{{}}".format(*self.server_address[:2])
+
+    def create_export(self, entity):
+        with self.lock:
+            export_id = "bench-{}".format(len(self.exports) + 1)
+            self.exports[export_id] = {"entity": entity, "polls": 0}
+            return export_id
+
+    def poll(self, export_id):
+        with self.lock:
+            export = self.exports[export_id]
+            export["polls"] += 1
+            return export["polls"] > self.ready_after
+
+    def body(self, export_id):
+        entity = self.exports[export_id]["entity"]
+        with self.lock:
+            if entity not in self.bodies:
+                self.bodies[entity] = synthetic_csv(entity, self.rows, empty_ratio=self.empty_ratio,
+                                                    multiline_ratio=self.multiline_ratio)
+            return self.bodies[entity]
+
+    def compressed_body(self, export_id):
+        entity = self.exports[export_id]["entity"]
+        body = self.body(export_id)
+        with self.lock:
+            if entity not in self.compressed_bodies:
+                self.compressed_bodies[entity] = gzip.compress(body, compresslevel=6)
+            return self.compressed_bodies[entity]
+
+
+class ExportHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+    def send_json(self, status, body):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        match = EXPORT_PATH.match(self.path)
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not match or match.group(1) or request.get("type") not in EXPORT_TYPES:
+            self.send_json(400, {"message": "unsupported export request"})
+            return
+        self.send_json(200, {"id": self.server.create_export(EXPORT_TYPES[request["type"]])})
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        match = EXPORT_PATH.match(self.path)
+        if not match or match.group(1) not in self.server.exports:
+            self.send_json(404, {"message": "not found"})
+            return
+
+        export_id = match.group(1)
+        if not match.group(2):
+            ready = self.server.poll(export_id)
+            self.send_json(200, {"id": export_id, "status": "COMPLETED" if ready else "PENDING"})
+            return
+
+        ranged = re.match(r"^bytes=(\d+)-$", self.headers.get("Range", ""))
+        if not ranged and self.server.compress and "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = self.server.compressed_body(export_id)
+            self.send_response(200)
+            self.send_header("Content-Type", "text/csv")
+            self.send_header("Content-Encoding", "gzip")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        body = self.server.body(export_id)
+        offset = min(int(ranged.group(1)), len(body)) if ranged else 0
+        self.send_response(206 if ranged else 200)
+        self.send_header("Content-Type", "text/csv")
+        self.send_header("Content-Length", str(len(body) - offset))
+        if ranged:
+            self.send_header("Content-Range", "bytes {}-{}/{}".format(offset, len(body) - 1, len(body)))
+        self.end_headers()
+        self.wfile.write(memoryview(body)[offset:])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--empty-ratio", type=float, default=0.1)
+    parser.add_argument("--multiline-ratio", type=float, default=0.0)
+    parser.add_argument("--ready-after", type=int, default=0)
+    parser.add_argument("--no-compression", action="store_true")
+    args = parser.parse_args()
+
+    server = ExportServer(("127.0.0.1", args.port), rows=args.rows, empty_ratio=args.empty_ratio,
+                          multiline_ratio=args.multiline_ratio, ready_after=args.ready_after,
+                          compress=not args.no_compression)
+    print("Serving exports at {}".format(server.base_url))
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Synthetic SaaSquatch export data shared by the benchmarks in this directory
+"""
+
+import csv
+import io
+import random
+
+from tap_referral_saasquatch.schema import get_schemas
+from tap_referral_saasquatch.transform import TRANSFORMS, transform_timestamp
+
+EPOCH_MILLIS_START = 1483228800000  # 2017-01-01
+EPOCH_MILLIS_END = 1767225600000  # 2026-01-01
+
+
+def export_fields(entity):
+    schemas, _ = get_schemas()
+    return list(schemas[entity]["properties"].keys())
+
+
+def synthetic_value(entity, field, index, rng, empty_ratio):
+    if rng.random() < empty_ratio:
+        return ""
+    converter = TRANSFORMS.get(entity, {}).get(field)
+    if converter is transform_timestamp:
+        return str(rng.randrange(EPOCH_MILLIS_START, EPOCH_MILLIS_END))
+    if converter is int:
+        return str(rng.randrange(0, 100000))
+    if field == "id":
+        return "{}-{:010d}".format(entity, index)
+    return "{}-{}".format(field, rng.randrange(0, 5000))
+
+
+def synthetic_rows(entity, count, seed=0, empty_ratio=0.1):
+    """
+    Yield count export rows for entity as dicts keyed by CSV column, the way
+    stream_export produces them
+    """
+
+    rng = random.Random(seed)
+    fields = export_fields(entity)
+    for index in range(count):
+        yield {field: synthetic_value(entity, field, index, rng, empty_ratio) for field in fields}
+
+
+def synthetic_csv(entity, count, seed=0, empty_ratio=0.1, multiline_ratio=0.0):
+    """
+    Return a CSV export for entity as bytes. multiline_ratio controls how many
+    string values contain a quoted embedded newline
+    """
+
+    rng = random.Random(seed)
+    fields = export_fields(entity)
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\n")
+    writer.writerow(fields)
+    for row in synthetic_rows(entity, count, seed, empty_ratio):
+        if multiline_ratio:
+            for field in fields:
+                if row[field] and not row[field].isdigit() and rng.random() < multiline_ratio:
+                    row[field] = row[field] + "\nline two"
+        writer.writerow([row[field] for field in fields])
+    return buf.getvalue().encode("utf-8")
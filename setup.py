@@ -18,6 +18,9 @@ setup(name='tap-referral-saasquatch',
         'dev': [
             'pylint==4.0.5',
             'pytest==8.4.1'
+        ],
+        'numpy': [
+            'numpy==2.4.6'
         ]
       },
       entry_points='''
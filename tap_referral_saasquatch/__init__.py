@@ -1,35 +1,76 @@
 #!/usr/bin/env python3
 
+import asyncio
+import collections
+import contextlib
+import cProfile
 import datetime
+import itertools
+import multiprocessing
+import operator
 import os
 import sys
+import tempfile
 import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-import backoff
 import requests
 import singer
 import csv
 import json
 
-from singer import (utils, metadata, write_record)
+from singer import (utils, metadata)
+from tap_referral_saasquatch.cache import DownloadCache, ExportCache
+from tap_referral_saasquatch.changes import DELETED_AT_PROPERTY, ChangeIndex
+from tap_referral_saasquatch.client import DOWNLOAD_CHUNK_SIZE, SaaSquatchClient, open_text
+from tap_referral_saasquatch.dedup import KeyFilter
 from tap_referral_saasquatch.discover import discover
+from tap_referral_saasquatch.engine import (ClientTransport, EventLoopThread, ExportEngine, bounded,
+                                            iter_async)
+from tap_referral_saasquatch.output import RecordWriter
+from tap_referral_saasquatch.parallel import (PARSE_CHUNK_BYTES, iter_ordered, read_header,
+                                              row_ranges, transform_chunk)
+from tap_referral_saasquatch.profiling import StageProfiler
+from tap_referral_saasquatch.spool import (SPOOL_CHUNK_SIZE, iter_spooled_lines, partial_size,
+                                           remove_spool, spool_download, spool_path)
+from tap_referral_saasquatch.streams import STREAMS
+# TRANSFORMS and the transform_* helpers are re-exported for code that
+# imports them from the package
+from tap_referral_saasquatch.transform import (TRANSFORMS, column_transforms,
+                                               compile_transformer, selected_fields,
+                                               transform_field, transform_row,
+                                               transform_timestamp, transform_values)
 
 
-BASE_URL = "https://app.referralsaasquatch.com/api/v1/{}"
 CONFIG = {
     'api_key': None,
     'tenant_alias': None,
     'start_date': None,
 }
 STATE = {}
-entity_export_types = {
-    "users": "USER",
-    "reward_balances": "REWARD_BALANCE",
-    "referrals": "REFERRAL",
-}
+REQUIRED_CONFIG_KEYS = ['api_key', 'tenant_alias', 'start_date']
+PROGRESS_LOG_INTERVAL = 10000
+TRANSFORM_BATCH_SIZE = 1000
+CHECKPOINT_ROWS = 100000
+CHECKPOINT_INTERVAL = 300
 
 logger = singer.get_logger()
-session = requests.Session()
+CLIENT = SaaSquatchClient(CONFIG)
+OUTPUT = RecordWriter()
+PROFILER = StageProfiler()
+EXPORT_CACHE = ExportCache(CONFIG)
+DOWNLOAD_CACHE = DownloadCache(CONFIG)
+ENGINE = ExportEngine(CONFIG, ClientTransport(CLIENT), cache=EXPORT_CACHE, profiler=PROFILER)
+# Streams being deduplicated by key_properties during the current sync
+KEY_FILTERS = {}
+# FULL_TABLE streams emitting only rows changed since the previous sync
+CHANGE_INDEXES = {}
+# Bookmarks of every tenant during a multi-tenant sync, keyed by tenant
+# alias. The entry of the tenant being synced is STATE itself
+TENANT_STATES = {}
+# Exports requested before a multi-tenant sync reaches their tenant, keyed by
+# (tenant_alias, entity, since, until)
+PREFETCHED_EXPORTS = {}
 
 
 def get_start(entity):
@@ -39,6 +80,10 @@ def get_start(entity):
     return STATE[entity]
 
 
+def config_flag(name):
+    return str(CONFIG.get(name, False)).lower() == 'true'
+
+
 def get_abs_path(path):
     return os.path.join(os.path.dirname(os.path.realpath(__file__)), path)
 
@@ -47,237 +92,652 @@ def load_schema(entity_name):
     return utils.load_json(get_abs_path('schemas/{}.json'.format(entity_name)))
 
 
+def run_async(coroutine):
+    """Run an engine coroutine to completion from synchronous code"""
+
+    return asyncio.run(coroutine)
+
+
+def export_status(export_id):
+    return run_async(ENGINE.export_status(export_id))
+
+
 def export_ready(export_id):
-    url = BASE_URL.format(CONFIG['tenant_alias']) + "/export/{}".format(export_id)
-    auth = ("", CONFIG['api_key'])
-    headers = {'Content-Type': "application/json"}
-    if 'user_agent' in CONFIG:
-        headers['User-Agent'] = CONFIG['user_agent']
-
-    resp = requests.get(url, auth=auth, headers=headers)
-    result = resp.json()
-    return result['status'] == 'COMPLETED'
-
-
-@backoff.on_exception(backoff.expo,
-                      (requests.exceptions.RequestException),
-                      max_tries=5,
-                      giveup=lambda e: e.response is not None and 400 <= e.response.status_code < 500,
-                      factor=2)
-def request_export(entity):
-    url = BASE_URL.format(CONFIG['tenant_alias']) + "/export"
-    auth = ("", CONFIG['api_key'])
-    headers = {'Content-Type': "application/json"}
-    if 'user_agent' in CONFIG:
-        headers['User-Agent'] = CONFIG['user_agent']
-
-    data = {
-        "type": entity_export_types[entity],
-        "format": "CSV",
-        "name": "Stitch Streams {}:{}".format(entity, datetime.datetime.now(datetime.UTC)),
-        "params": {
-            "createdOrUpdatedSince": get_start(entity),
-        },
-    }
+    return export_status(export_id)[0]
+
+
+def wait_for_export(entity, export_id, cancelled=None):
+    run_async(ENGINE.wait_for_export(entity, export_id, cancelled=cancelled))
+
 
-    req = requests.Request('POST', url, auth=auth, headers=headers, json=data).prepare()
-    logger.info("POST {} body={}".format(req.url, data))
-    resp = session.send(req)
-    if resp.status_code >= 400:
-        logger.critical("Error submitting request for export: POST {}: [{} - {}]".format(req.url, resp.status_code, resp.content))
+def request_export(entity, cancelled=None, since=None, until=None):
+    since = since or get_start(entity)
+    try:
+        export_id = run_async(ENGINE.create_export(entity, since, until))
+    except requests.exceptions.HTTPError:
         sys.exit(1)
 
-    result = resp.json()
+    wait_for_export(entity, export_id, cancelled=cancelled)
+    return export_id
 
-    if 'id' in result:
-        waited = 0
-        while waited <= 3600:
-            if export_ready(result['id']):
-                return result['id']
 
-            time.sleep(5)
-            waited += 5
+def export_chunks(export_id, offset=0, chunk_size=DOWNLOAD_CHUNK_SIZE):
+    """
+    Return an iterator over the bytes of an export download from offset,
+    read from the download cache when it has the export
+    """
 
-        raise Exception("{} export took over an hour to complete. Aborting."
-                        .format(entity))
+    cached = DOWNLOAD_CACHE.read(export_id, offset)
+    if cached is not None:
+        logger.info("Reading export {} from the download cache".format(export_id))
+        return cached
+
+    chunks = iter_async(ENGINE.download(export_id, offset=offset, chunk_size=chunk_size))
+    if offset == 0:
+        chunks = DOWNLOAD_CACHE.write_through(export_id, chunks)
+    return chunks
 
-    else:
-        raise Exception("Request to create {} export failed: {} - {}"
-                        .format(entity, resp.status_code, resp.content))
 
+def spool_export(export_id, entity=None, spool_dir=None):
+    """
+    Download an export to a file in spool_dir, resuming a partial download,
+    and return its path. An existing complete spool is reused
+    """
 
-def stream_export(entity, export_id):
-    url = BASE_URL.format(CONFIG['tenant_alias']) + "/export/{}/download".format(export_id)
-    auth = ("", CONFIG['api_key'])
-    headers = {'Content-Type': "application/json"}
-    resp = requests.get(url, auth=auth, headers=headers, stream=True)
+    path = spool_path(spool_dir or CONFIG['spool_dir'], CONFIG['tenant_alias'], export_id)
+    if os.path.exists(path):
+        logger.info("Parsing export {} from existing spool {}".format(export_id, path))
+    else:
+        offset = partial_size(path)
+        if offset:
+            logger.info("Resuming spool of export {} after {} bytes".format(export_id, offset))
+        chunks = export_chunks(export_id, offset=offset, chunk_size=SPOOL_CHUNK_SIZE)
+        spool_download(PROFILER.timed_iter(entity, "download", chunks, counter="bytes"), path)
+        logger.info("Spooled export {} to {} ({} bytes)"
+                    .format(export_id, path, os.path.getsize(path)))
+    return path
+
+
+def spooled_export_lines(export_id, entity=None):
+    path = spool_export(export_id, entity)
+    yield from iter_spooled_lines(path)
+    # Only a fully parsed spool is removed, so a failed parse can be retried
+    # from disk
+    os.remove(path)
+
+
+def discard_spool(export_id):
+    """
+    Remove whatever was spooled of an export that will not be synced, from
+    spool_dir and from the temp directory parse_workers spools to
+    """
+
+    spool_dirs = {CONFIG.get('spool_dir'), tempfile.gettempdir()} - {None}
+    for spool_dir in spool_dirs:
+        path = spool_path(spool_dir, CONFIG['tenant_alias'], export_id)
+        if remove_spool(path):
+            logger.info("Removed spool {} of export {}".format(path, export_id))
+
+
+def column_projection(header, fields):
+    """
+    Return the names of the header columns in fields, in header order, and a
+    callable picking their values out of a parsed CSV row as a tuple
+    """
+
+    if fields is None:
+        return list(header), tuple
+
+    wanted = set(fields)
+    indexes = [index for index, name in enumerate(header) if name in wanted]
+    names = [header[index] for index in indexes]
+    if indexes == list(range(len(header))):
+        return names, tuple
+    if len(indexes) > 1:
+        return names, operator.itemgetter(*indexes)
+    return names, lambda row: tuple(row[index] for index in indexes)
+
+
+def export_rows(entity, export_id, fields=None):
+    """
+    Start reading an export and return its column names and an iterator of
+    rows as tuples of values laid out like the names. When fields is given,
+    only those columns are extracted
+    """
+
+    if CONFIG.get('spool_dir'):
+        f = (line.decode('utf-8') for line in spooled_export_lines(export_id, entity))
+    else:
+        f = open_text(PROFILER.timed_iter(entity, "download", export_chunks(export_id), counter="bytes"))
 
-    rows = []
-    f = (line.decode('utf-8') for line in iter_lines(resp))
     linereader = csv.reader(f)
-    fields = next(linereader)
+    header = next(linereader, None)
+    if header is None:
+        return [], iter(())
+
+    names, project = column_projection(header, fields)
+    return names, project_rows(linereader, project, header, names)
 
+
+def project_rows(linereader, project, header, names):
+    width = len(header)
+    positions = [header.index(name) for name in names]
     for row in linereader:
-        row = dict(zip(fields, row))
-        rows.append(row)
-
-    return rows
-
-# This function is copied from
-# https://github.com/requests/requests/blob/9c6bd54b44c0b05c6907522e8d9998a87b69c1cd/requests/models.py#L782
-# Note: when requests 3.0 is released, we should simply use their built-in
-# Response.iter_lines() function and remove this duplicate.
-def iter_lines(response, chunk_size=requests.models.ITER_CHUNK_SIZE, decode_unicode=None, delimiter=None):
-    """Iterates over the response data, one line at a time.  When
-        stream=True is set on the request, this avoids reading the
-        content at once into memory for large responses.
-        .. note:: This method is not reentrant safe.
-        """
-    carriage_return = u'\r' if decode_unicode else b'\r'
-    line_feed = u'\n' if decode_unicode else b'\n'
-
-    pending = None
-    last_chunk_ends_with_cr = False
-
-    for chunk in response.iter_content(chunk_size=chunk_size,
-                                    decode_unicode=decode_unicode):
-        # Skip any null responses: if there is pending data it is necessarily an
-        # incomplete chunk, so if we don't have more data we don't want to bother
-        # trying to get it. Unconsumed pending data will be yielded anyway in the
-        # end of the loop if the stream ends.
-        if not chunk:
-            continue
-
-        # Consume any pending data
-        if pending is not None:
-            chunk = pending + chunk
-            pending = None
-
-        # Either split on a line, or split on a specified delimiter
-        if delimiter:
-            lines = chunk.split(delimiter)
+        if len(row) == width:
+            yield project(row)
         else:
-            # Python splitlines() supports the universal newline (PEP 278).
-            # That means, '\r', '\n', and '\r\n' are all treated as end of
-            # line. If the last chunk ends with '\r', and the current chunk
-            # starts with '\n', they should be merged and treated as only
-            # *one* new line separator '\r\n' by splitlines().
-            # This rule only applies when splitlines() is used.
-
-            # The last chunk ends with '\r', so the '\n' at chunk[0]
-            # is just the second half of a '\r\n' pair rather than a
-            # new line break. Just skip it.
-            skip_first_char = last_chunk_ends_with_cr and chunk.startswith(line_feed)
-            last_chunk_ends_with_cr = chunk.endswith(carriage_return)
-            if skip_first_char:
-                chunk = chunk[1:]
-                # it's possible that after stripping the '\n' then chunk becomes empty
-                if not chunk:
-                    continue
-            lines = chunk.splitlines()
-
-        # Calling `.split(delimiter)` will always end with whatever text
-        # remains beyond the delimiter, or '' if the delimiter is the end
-        # of the text.  On the other hand, `.splitlines()` doesn't include
-        # a '' if the text ends in a line delimiter.
-        #
-        # For example:
-        #
-        #     'abc\ndef\n'.split('\n')  ~> ['abc', 'def', '']
-        #     'abc\ndef\n'.splitlines() ~> ['abc', 'def']
-        #
-        # So if we have a specified delimiter, we always pop the final
-        # item and prepend it to the next chunk.
-        #
-        # If we're using `splitlines()`, we only do this if the chunk
-        # ended midway through a line.
-        incomplete_line = lines[-1] and lines[-1][-1] == chunk[-1]
-        if delimiter or incomplete_line:
-            pending = lines.pop()
-
-        for line in lines:
-            yield line
-
-    if pending is not None:
-        yield pending
-
-def transform_timestamp(value):
-    if not value:
-        return None
-
-    return utils.strftime(datetime.datetime.fromtimestamp(int(value) * 0.001, tz=datetime.UTC))
-
-
-TRANSFORMS = {
-    "users": {
-        "dateCreated": transform_timestamp,
-    },
-    "reward_balances": {
-        "amount": int,
-    },
-    "referrals": {
-        "dateReferralStarted": transform_timestamp,
-        "dateReferralPaid": transform_timestamp,
-        "dateReferralEnded": transform_timestamp,
-        "dateModerated": transform_timestamp,
-        "dateConverted": transform_timestamp,
-    },
-}
+            # Values present in a short row are a prefix of names
+            yield tuple(row[index] for index in positions if index < len(row))
 
 
-def transform_field(entity, field, value):
-    if field in TRANSFORMS[entity]:
-        return TRANSFORMS[entity][field](value)
-    return value
+def stream_export(entity, export_id, fields=None):
+    """Yield each row of an export as a dict keyed by CSV header"""
 
+    names, rows = export_rows(entity, export_id, fields=fields)
+    for values in rows:
+        yield dict(zip(names, values))
 
-def transform_row(entity, row):
-    return {field: transform_field(entity, field, value) for field, value in row.items()}
 
+def stream_name(entity):
+    return CONFIG.get('stream_prefix', '') + entity
 
-def sync_entity(entity, key_properties, catalog, transformer):
+
+def write_record(entity, record):
+    OUTPUT.write_record(stream_name(entity), record)
+
+
+def write_state():
+    # Buffered records must reach the target before the state that covers them
+    OUTPUT.flush()
+    singer.write_state({'tenants': TENANT_STATES} if TENANT_STATES else STATE)
+
+
+def write_entity_schema(entity, key_properties):
     start_date = get_start(entity)
     logger.info("{}: Starting sync from {}".format(entity, start_date))
 
     schema = load_schema(entity)
-    singer.write_schema(entity, schema, key_properties)
+    if entity in CHANGE_INDEXES and config_flag('emit_deletions'):
+        schema['properties'][DELETED_AT_PROPERTY] = {"type": ["null", "string"], "format": "date-time"}
+    OUTPUT.flush()
+    singer.write_schema(stream_name(entity), schema, key_properties)
     logger.info("{}: Sent schema".format(entity))
 
-    logger.info("{}: Requesting export".format(entity))
-    export_start = utils.strftime(datetime.datetime.now(datetime.UTC))
-    export_id = request_export(entity)
 
-    logger.info("{}: Export ready".format(entity))
+def get_current_export(entity):
+    return STATE.get('current_exports', {}).get(entity)
 
-    rows = stream_export(entity, export_id)
-    logger.info("{}: Got {} records".format(entity, len(rows)))
 
-    catalog_stream = catalog.get_stream(entity)
-    meta_data = metadata.to_map(catalog.metadata)
+def set_current_export(entity, export_id, export_start, rows, since=None, until=None):
+    STATE.setdefault('current_exports', {})[entity] = {
+        'id': export_id,
+        'export_start': export_start,
+        'rows': rows,
+        'since': since,
+        'until': until,
+    }
+
+
+def clear_current_export(entity):
+    current_exports = STATE.get('current_exports', {})
+    current_exports.pop(entity, None)
+    if not current_exports:
+        STATE.pop('current_exports', None)
 
-    for row in rows:
-        transformed_row = transformer.transform(
-            row, catalog_stream.schema.to_dict(), meta_data
-        )
-        write_record(entity, transformed_row)
 
+async def export_downloadable(export_id):
+    try:
+        ready, _ = await ENGINE.export_status(export_id)
+    except requests.exceptions.HTTPError:
+        return False
+    return ready
+
+
+def export_windows(entity):
+    """
+    Return the (since, until) ranges to export for entity. Normally this is
+    a single open-ended range from the bookmark. With export_window_days set,
+    a backfill from an old bookmark is split into windows of that many days,
+    and only the last window is left open ended.
+
+    Windowing is only used when export_window_end_param names the export
+    parameter that bounds an export from above. Without a working bound each
+    window would export everything since its start, and the bookmark would
+    still move to its end
+    """
+
+    since = get_start(entity)
+    window_days = float(CONFIG.get('export_window_days') or 0)
+    if window_days and not CONFIG.get('export_window_end_param'):
+        logger.warning("{}: Ignoring export_window_days because export_window_end_param is not set"
+                       .format(entity))
+        window_days = 0
+    if not window_days or not since:
+        return [(since, None)]
+
+    window = datetime.timedelta(days=window_days)
+    now = datetime.datetime.now(datetime.UTC)
+    window_start = utils.strptime_to_utc(since)
+    windows = []
+    while window_start + window < now:
+        until = utils.strftime(window_start + window)
+        windows.append((since, until))
+        since = until
+        window_start += window
+    windows.append((since, None))
+
+    if len(windows) > 1:
+        logger.info("{}: Backfilling from {} in {} windows of {} days"
+                    .format(entity, windows[0][0], len(windows), window_days))
+    return windows
+
+
+async def prepare_export(entity, since=None, until=None, cancelled=None):
+    """
+    Return (export_start, export_id) of a ready export of entity from since
+    to until: the one being synced when the previous run stopped, one
+    requested ahead by a multi-tenant sync, the one in the export cache or a
+    new one, in that order
+    """
+
+    since = since or get_start(entity)
+    current = get_current_export(entity)
+    if current is not None and current.get('since', since) == since and current.get('until') == until:
+        if await export_downloadable(current['id']):
+            logger.info("{}: Resuming export {} after {} rows"
+                        .format(entity, current['id'], current['rows']))
+            return current['export_start'], current['id']
+        logger.info("{}: Export {} from the previous run is no longer available"
+                    .format(entity, current['id']))
+
+    prefetched = PREFETCHED_EXPORTS.pop((CONFIG['tenant_alias'], entity, since, until), None)
+    if prefetched is not None:
+        export_start, export_id = await asyncio.wrap_future(prefetched)
+        logger.info("{}: Using export {} requested ahead of the sync".format(entity, export_id))
+        return export_start, export_id
+
+    export_start, export_id = await ENGINE.ensure_export(entity, since, until, cancelled=cancelled)
+    logger.info("{}: Export {} ready".format(entity, export_id))
+    return export_start, export_id
+
+
+def export_entity(entity, cancelled=None, since=None, until=None):
+    return run_async(prepare_export(entity, since=since, until=until, cancelled=cancelled))
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def transform_records(entity, names, rows, schema, meta_data, transformer):
+    """
+    Transform rows given as tuples of values laid out like names into
+    records. Only the records themselves are built as dicts
+    """
+
+    record_transformer = compile_transformer(entity, schema, meta_data)
+    if record_transformer is None:
+        logger.info("{}: Schema has types the compiled transformer does not support, "
+                    "falling back to singer.Transformer".format(entity))
+        transforms = column_transforms(entity, names)
+        for values in rows:
+            yield transformer.transform(dict(zip(names, transform_values(values, transforms))),
+                                        schema, meta_data)
+        return
+
+    for batch in batched(rows, TRANSFORM_BATCH_SIZE):
+        yield from record_transformer.transform_values_batch(names, batch)
+
+
+def parallel_records(entity, export_id, fields, schema, meta_data, workers):
+    """
+    Spool an export to disk, split it on row boundaries and parse and
+    transform the pieces across a pool of worker processes, yielding records
+    in export order
+    """
+
+    path = spool_export(export_id, entity, spool_dir=CONFIG.get('spool_dir') or tempfile.gettempdir())
+    chunk_bytes = int(CONFIG.get('parse_chunk_bytes', PARSE_CHUNK_BYTES))
+    header_range, ranges = row_ranges(path, chunk_bytes)
+    if header_range is not None:
+        header = read_header(path, header_range)
+        calls = ((path, start, end, entity, header, fields, schema, meta_data) for start, end in ranges)
+        # Worker processes are spawned rather than forked because export
+        # polling may be running on other threads
+        with ProcessPoolExecutor(max_workers=workers,
+                                 mp_context=multiprocessing.get_context("spawn")) as executor:
+            for records in iter_ordered(executor, transform_chunk, calls, window=workers * 2):
+                yield from records
+    os.remove(path)
+
+
+def sync_export(entity, export_id, export_start, catalog, transformer, since=None, until=None):
+    catalog_stream = catalog.get_stream(entity)
+    meta_data = metadata.to_map(catalog_stream.metadata)
+
+    current = get_current_export(entity)
+    skip_rows = current['rows'] if current is not None and current['id'] == export_id else 0
+    if current is not None and current['id'] != export_id:
+        # The export being synced when the previous run stopped is replaced,
+        # so its spool would never be picked up again
+        discard_spool(current['id'])
+    set_current_export(entity, export_id, export_start, skip_rows, since, until)
+    write_state()
+
+    change_index = CHANGE_INDEXES.get(entity)
+    if skip_rows:
+        if change_index is not None:
+            change_index.mark_partial()
+        logger.info("{}: Skipping {} rows already synced from export {}"
+                    .format(entity, skip_rows, export_id))
+
+    checkpoint_rows = int(CONFIG.get('checkpoint_rows', CHECKPOINT_ROWS)) or float('inf')
+    checkpoint_interval = float(CONFIG.get('checkpoint_interval', CHECKPOINT_INTERVAL)) or float('inf')
+    next_checkpoint_rows = checkpoint_rows
+    next_checkpoint_time = time.monotonic() + checkpoint_interval
+
+    key_filter = KEY_FILTERS.get(entity)
+    write = PROFILER.timed_call(entity, "write", write_record)
+    started = time.monotonic()
+    record_count = 0
+    duplicate_count = 0
+    unchanged_count = 0
+    try:
+        schema = catalog_stream.schema.to_dict()
+        fields = selected_fields(schema, meta_data)
+        parse_workers = int(CONFIG.get('parse_workers', 1))
+        if parse_workers > 1:
+            records = itertools.islice(
+                parallel_records(entity, export_id, fields, schema, meta_data, parse_workers),
+                skip_rows, None)
+        else:
+            names, rows = export_rows(entity, export_id, fields=fields)
+            rows = PROFILER.timed_iter(entity, "parse", itertools.islice(rows, skip_rows, None))
+            records = transform_records(entity, names, rows, schema, meta_data, transformer)
+        for transformed_row in PROFILER.timed_iter(entity, "transform", records):
+            if key_filter is not None and not key_filter.add(transformed_row):
+                duplicate_count += 1
+            elif change_index is not None and not change_index.changed(transformed_row):
+                unchanged_count += 1
+            else:
+                write(entity, transformed_row)
+            record_count += 1
+            if record_count % PROGRESS_LOG_INTERVAL == 0:
+                logger.info("{}: Synced {} records so far".format(entity, record_count))
+            if record_count >= next_checkpoint_rows or time.monotonic() >= next_checkpoint_time:
+                set_current_export(entity, export_id, export_start, skip_rows + record_count, since, until)
+                write_state()
+                next_checkpoint_rows = record_count + checkpoint_rows
+                next_checkpoint_time = time.monotonic() + checkpoint_interval
+    except Exception:
+        # Everything written so far has reached the target, so a restart
+        # can pick up the same export after these rows
+        set_current_export(entity, export_id, export_start, skip_rows + record_count, since, until)
+        write_state()
+        raise
+    finally:
+        PROFILER.count(entity, "rows", record_count)
+        PROFILER.add_wall_time(entity, time.monotonic() - started)
+
+    logger.info("{}: Got {} records".format(entity, record_count))
+    if duplicate_count:
+        logger.info("{}: Dropped {} records already synced from an overlapping export"
+                    .format(entity, duplicate_count))
+    if unchanged_count:
+        logger.info("{}: Skipped {} records unchanged since the previous sync"
+                    .format(entity, unchanged_count))
+
+    clear_current_export(entity)
+    EXPORT_CACHE.remove(entity, since, until)
     utils.update_state(STATE, entity, export_start)
-    singer.write_state(STATE)
+    write_state()
     logger.info("{}: State synced to {}".format(entity, export_start))
 
 
+def finish_change_index(entity):
+    """
+    Emit rows that disappeared since the previous sync when emit_deletions
+    is set, then save a new generation of the stream's change index and
+    record it in the state. The next sync only compares against it once the
+    target has committed that state
+    """
+
+    change_index = CHANGE_INDEXES.get(entity)
+    if change_index is None:
+        return
+
+    if config_flag('emit_deletions'):
+        deleted_at = utils.strftime(datetime.datetime.now(datetime.UTC))
+        deleted_count = 0
+        for record in change_index.deleted():
+            record[DELETED_AT_PROPERTY] = deleted_at
+            write_record(entity, record)
+            deleted_count += 1
+        logger.info("{}: Emitted {} deleted records".format(entity, deleted_count))
+
+    STATE.setdefault('change_indexes', {})[entity] = change_index.save()
+    write_state()
+
+
+def sync_entity(entity, key_properties, catalog, transformer):
+    write_entity_schema(entity, key_properties)
+    for since, until in export_windows(entity):
+        export_start, export_id = export_entity(entity, since=since, until=until)
+        sync_export(entity, export_id, export_start, catalog, transformer, since=since, until=until)
+    finish_change_index(entity)
+
+
+def sync_entities_concurrently(entities, key_properties, catalog, transformer, max_workers):
+    """
+    Request and poll every export, including every backfill window, on one
+    event loop with at most max_workers in flight, then download and emit
+    each one from the calling thread as soon as it and all earlier windows
+    of its stream are ready, so Singer messages are never interleaved between
+    streams and bookmarks only move forward
+    """
+
+    windows = {}
+    for entity in entities:
+        write_entity_schema(entity, key_properties[entity])
+        windows[entity] = export_windows(entity)
+
+    loop_thread = EventLoopThread()
+    limit = asyncio.Semaphore(max_workers)
+    try:
+        queues = {}
+        jobs = {}
+        for entity in entities:
+            queues[entity] = collections.deque()
+            for since, until in windows[entity]:
+                future = loop_thread.submit(bounded(limit, prepare_export(entity, since, until)))
+                queues[entity].append(future)
+                jobs[future] = (entity, since, until)
+
+        for completed in as_completed(jobs):
+            queue = queues[jobs[completed][0]]
+            while queue and queue[0].done():
+                future = queue.popleft()
+                entity, since, until = jobs[future]
+                export_start, export_id = future.result()
+                sync_export(entity, export_id, export_start, catalog, transformer,
+                            since=since, until=until)
+                if not queue:
+                    finish_change_index(entity)
+    finally:
+        # Exports still being requested or polled are cancelled
+        loop_thread.close()
+
+
 def do_sync(catalog):
     logger.info("Starting Referral Saasquatch sync")
-    key_properties = {"users": ["id", "accountId"],
-                      "reward_balances": ["userId", "accountId"],
-                      "referrals": ["id"]}
+    key_properties = {name: stream.key_properties for name, stream in STREAMS.items()}
+    max_workers = int(CONFIG.get('max_concurrent_exports', 1))
+    OUTPUT.configure(CONFIG)
+    PROFILER.configure(CONFIG)
     with singer.Transformer() as transformer:
-        for stream_to_sync in catalog.get_selected_streams(STATE):
-            sync_entity(stream_to_sync.stream, key_properties[stream_to_sync.stream], catalog, transformer)
+        selected_streams = [stream.stream for stream in catalog.get_selected_streams(STATE)]
+        KEY_FILTERS.clear()
+        CHANGE_INDEXES.clear()
+        for stream_to_sync in selected_streams:
+            # Only INCREMENTAL streams have unique key_properties; FULL_TABLE
+            # reward_balances has a row per balance type of each user
+            if config_flag('dedup_records') and STREAMS[stream_to_sync].replication_method == "INCREMENTAL":
+                KEY_FILTERS[stream_to_sync] = KeyFilter(key_properties[stream_to_sync])
+            if CONFIG.get('change_index_dir') and STREAMS[stream_to_sync].replication_method == "FULL_TABLE":
+                CHANGE_INDEXES[stream_to_sync] = ChangeIndex(
+                    CONFIG['change_index_dir'],
+                    "{}-{}".format(CONFIG['tenant_alias'], stream_to_sync),
+                    key_properties[stream_to_sync],
+                    generation=STATE.get('change_indexes', {}).get(stream_to_sync))
+        # cProfile only sees the calling thread, which does all the
+        # downloading, parsing and writing
+        profile = cProfile.Profile() if CONFIG.get('profile_path') else None
+        if profile is not None:
+            profile.enable()
+        try:
+            if max_workers > 1:
+                sync_entities_concurrently(selected_streams, key_properties, catalog,
+                                           transformer, max_workers)
+            else:
+                for stream_to_sync in selected_streams:
+                    sync_entity(stream_to_sync, key_properties[stream_to_sync], catalog, transformer)
+        finally:
+            OUTPUT.flush()
+            if profile is not None:
+                profile.disable()
+                profile.dump_stats(CONFIG['profile_path'])
+                logger.info("Wrote profile to {}".format(CONFIG['profile_path']))
+            PROFILER.emit()
 
     logger.info("Sync complete")
 
 
+def tenant_configs():
+    """
+    Return the config of each tenant listed under tenants, which is the
+    top-level config with the tenant's own keys laid over it. Every stream
+    of a tenant is emitted with its alias in the stream_prefix, after any
+    top-level stream_prefix, unless the tenant sets its own
+    """
+
+    base_config = {key: value for key, value in CONFIG.items() if key != 'tenants'}
+    configs = []
+    for tenant in CONFIG['tenants']:
+        tenant_config = dict(base_config)
+        tenant_config.update(tenant)
+        missing = [key for key in REQUIRED_CONFIG_KEYS if not tenant_config.get(key)]
+        if missing:
+            raise Exception("Tenant config is missing required keys: {}".format(", ".join(missing)))
+        if 'stream_prefix' not in tenant:
+            tenant_config['stream_prefix'] = "{}{}__".format(base_config.get('stream_prefix', ''),
+                                                             tenant_config['tenant_alias'])
+        configs.append(tenant_config)
+
+    aliases = [tenant_config['tenant_alias'] for tenant_config in configs]
+    if len(set(aliases)) != len(aliases):
+        raise Exception("Tenant aliases must be unique: {}".format(", ".join(aliases)))
+    return configs
+
+
+@contextlib.contextmanager
+def tenant_context(tenant_config):
+    """
+    Swap CONFIG and STATE for those of one tenant. They are updated in place
+    because the client and caches hold on to CONFIG
+    """
+
+    alias = tenant_config['tenant_alias']
+    base_config = dict(CONFIG)
+    base_state = dict(STATE)
+    CONFIG.clear()
+    CONFIG.update(tenant_config)
+    STATE.clear()
+    STATE.update(TENANT_STATES.get(alias, {}))
+    TENANT_STATES[alias] = STATE
+    try:
+        yield
+    finally:
+        TENANT_STATES[alias] = dict(STATE)
+        CONFIG.clear()
+        CONFIG.update(base_config)
+        STATE.clear()
+        STATE.update(base_state)
+
+
+def prefetch_jobs(catalog):
+    """
+    Return the (entity, since, until) of every export the current tenant's
+    sync will request, leaving out exports it will resume from its state
+    """
+
+    jobs = []
+    for stream in catalog.get_selected_streams(STATE):
+        for since, until in export_windows(stream.stream):
+            current = get_current_export(stream.stream)
+            if current is None or current.get('since', since) != since or current.get('until') != until:
+                jobs.append((stream.stream, since, until))
+    return jobs
+
+
+def prefetch_tenant_exports(loop_thread, tenant_config, jobs):
+    """
+    Start requesting and polling a tenant's exports on loop_thread, with at
+    most its max_concurrent_exports in flight. The tenant's client shares
+    the connection pool of CLIENT, and its export cache shares the lock of
+    EXPORT_CACHE
+    """
+
+    client = SaaSquatchClient(tenant_config, session=CLIENT.session)
+    engine = ExportEngine(tenant_config, ClientTransport(client), cache=ExportCache(tenant_config))
+    limit = asyncio.Semaphore(max(int(tenant_config.get('max_concurrent_exports', 1)), 1))
+    for entity, since, until in jobs:
+        PREFETCHED_EXPORTS[(tenant_config['tenant_alias'], entity, since, until)] = loop_thread.submit(
+            bounded(limit, engine.ensure_export(entity, since, until)))
+
+
+def do_multi_tenant_sync(catalog):
+    """
+    Sync every tenant listed under tenants one after another, so their
+    messages are never interleaved, while the exports of up to
+    max_concurrent_tenants tenants are requested and polled ahead on one
+    event loop. STATE is kept per tenant under its alias
+    """
+
+    tenants = tenant_configs()
+    lookahead = max(int(CONFIG.get('max_concurrent_tenants', 1)), 1)
+    TENANT_STATES.clear()
+    TENANT_STATES.update(STATE.pop('tenants', {}))
+    logger.info("Starting multi-tenant sync of {} tenants".format(len(tenants)))
+
+    jobs = []
+    for tenant_config in tenants:
+        with tenant_context(tenant_config):
+            jobs.append(prefetch_jobs(catalog))
+
+    loop_thread = EventLoopThread()
+    try:
+        for index, tenant_config in enumerate(tenants):
+            for ahead in range(index, min(index + lookahead, len(tenants))):
+                if jobs[ahead] is not None:
+                    prefetch_tenant_exports(loop_thread, tenants[ahead], jobs[ahead])
+                    jobs[ahead] = None
+            with tenant_context(tenant_config):
+                logger.info("Syncing tenant {}".format(tenant_config['tenant_alias']))
+                do_sync(catalog)
+    finally:
+        loop_thread.close()
+        PREFETCHED_EXPORTS.clear()
+        STATE['tenants'] = dict(TENANT_STATES)
+        TENANT_STATES.clear()
+
+    logger.info("Multi-tenant sync complete")
+
+
 def do_discover():
     logger.info("Starting discovery")
     catalog = discover()
@@ -286,7 +746,9 @@ def do_discover():
 
 
 def main_impl():
-    args = utils.parse_args(['api_key', 'tenant_alias', 'start_date'])
+    args = utils.parse_args(['start_date'])
+    if not args.config.get('tenants'):
+        utils.check_config(args.config, REQUIRED_CONFIG_KEYS)
     CONFIG.update(args.config)
 
     if args.state:
@@ -294,6 +756,8 @@ def main_impl():
 
     if args.discover:
         do_discover()
+    elif args.catalog and CONFIG.get('tenants'):
+        do_multi_tenant_sync(catalog=args.catalog)
     elif args.catalog:
         do_sync(catalog=args.catalog)
 
@@ -0,0 +1,191 @@
+import gzip
+import json
+import os
+import tempfile
+import threading
+import time
+
+import singer
+
+EXPORT_CACHE_TTL = 12 * 3600
+DOWNLOAD_CACHE_MAX_BYTES = 10 * 1024 ** 3
+DOWNLOAD_CACHE_COMPRESSLEVEL = 1
+DOWNLOAD_CACHE_READ_SIZE = 1024 * 1024
+
+LOGGER = singer.get_logger()
+
+# One lock per cache file, shared by every ExportCache writing to it, such as
+# the per-tenant caches of a multi-tenant sync
+PATH_LOCKS = {}
+PATH_LOCKS_GUARD = threading.Lock()
+
+
+def path_lock(path):
+    with PATH_LOCKS_GUARD:
+        return PATH_LOCKS.setdefault(os.path.abspath(path), threading.Lock())
+
+
+class ExportCache:
+    """
+    Sidecar JSON file mapping (tenant, entity, since, until) to the id of an
+    export already created for that range, so a retried run can pick the
+    export up again instead of waiting for SaaSquatch to build it a second
+    time. Entries older than export_cache_ttl seconds are ignored. The cache
+    is disabled unless export_cache_path is configured
+    """
+
+    def __init__(self, config):
+        self.config = config
+
+    @property
+    def path(self):
+        return self.config.get('export_cache_path')
+
+    @property
+    def lock(self):
+        return path_lock(self.path)
+
+    @property
+    def ttl(self):
+        return float(self.config.get('export_cache_ttl', EXPORT_CACHE_TTL))
+
+    def key(self, entity, since, until):
+        return "|".join([self.config['tenant_alias'], entity, since or "", until or ""])
+
+    def load(self):
+        try:
+            with open(self.path, "r") as cache_file:
+                entries = json.load(cache_file)
+        except (OSError, ValueError):
+            return {}
+
+        now = time.time()
+        return {key: entry for key, entry in entries.items()
+                if now - entry['created_at'] <= self.ttl}
+
+    def save(self, entries):
+        # A temp file of its own, so a writer in another process cannot
+        # replace it from under this one
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(self.path) + ".",
+                                        suffix=".tmp", dir=os.path.dirname(os.path.abspath(self.path)))
+        try:
+            with os.fdopen(fd, "w") as cache_file:
+                json.dump(entries, cache_file, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def get(self, entity, since, until):
+        if not self.path:
+            return None
+        with self.lock:
+            return self.load().get(self.key(entity, since, until))
+
+    def put(self, entity, since, until, export_id, export_start):
+        if not self.path:
+            return
+        with self.lock:
+            entries = self.load()
+            entries[self.key(entity, since, until)] = {
+                'id': export_id,
+                'export_start': export_start,
+                'created_at': time.time(),
+            }
+            self.save(entries)
+
+    def remove(self, entity, since, until):
+        if not self.path:
+            return
+        with self.lock:
+            entries = self.load()
+            if entries.pop(self.key(entity, since, until), None) is not None:
+                self.save(entries)
+
+
+class DownloadCache:
+    """
+    Directory of gzip-compressed export downloads keyed by tenant and export
+    id, so replaying an export reads it from disk instead of downloading it
+    again. Reading a file marks it as recently used; once the directory holds
+    more than download_cache_max_bytes the least recently used files are
+    deleted. The cache is disabled unless download_cache_dir is configured
+    """
+
+    def __init__(self, config):
+        self.config = config
+
+    @property
+    def directory(self):
+        return self.config.get('download_cache_dir')
+
+    @property
+    def max_bytes(self):
+        return int(self.config.get('download_cache_max_bytes', DOWNLOAD_CACHE_MAX_BYTES))
+
+    def path(self, export_id):
+        return os.path.join(self.directory, "{}-{}.csv.gz".format(self.config['tenant_alias'], export_id))
+
+    def read(self, export_id, offset=0):
+        """
+        Return an iterator over the cached download starting at byte offset,
+        or None if the export is not cached
+        """
+
+        if not self.directory or not os.path.exists(self.path(export_id)):
+            return None
+        os.utime(self.path(export_id))
+        return self.iter_cached(self.path(export_id), offset)
+
+    def iter_cached(self, path, offset):
+        with gzip.open(path, "rb") as cached:
+            while offset > 0:
+                skipped = len(cached.read(min(offset, DOWNLOAD_CACHE_READ_SIZE)))
+                if not skipped:
+                    return
+                offset -= skipped
+            yield from iter(lambda: cached.read(DOWNLOAD_CACHE_READ_SIZE), b"")
+
+    def write_through(self, export_id, chunks):
+        """
+        Pass chunks through unchanged while compressing them into the cache.
+        The file only becomes visible once every chunk has been read
+        """
+
+        if not self.directory:
+            return chunks
+        return self.iter_write_through(self.path(export_id), chunks)
+
+    def iter_write_through(self, path, chunks):
+        os.makedirs(self.directory, exist_ok=True)
+        part = path + ".part"
+        completed = False
+        try:
+            with gzip.open(part, "wb", compresslevel=DOWNLOAD_CACHE_COMPRESSLEVEL) as cached:
+                for chunk in chunks:
+                    cached.write(chunk)
+                    yield chunk
+            os.replace(part, path)
+            completed = True
+        finally:
+            if not completed and os.path.exists(part):
+                os.remove(part)
+        self.evict(keep=path)
+
+    def evict(self, keep=None):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".csv.gz"):
+                path = os.path.join(self.directory, name)
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            LOGGER.info("Evicting cached download %s (%s bytes)", path, size)
+            os.remove(path)
+            total -= size
@@ -0,0 +1,169 @@
+import array
+import bisect
+import gzip
+import hashlib
+import json
+import os
+
+import singer
+
+DELETED_AT_PROPERTY = "_sdc_deleted_at"
+INDEX_SUFFIXES = (".idx.gz", ".idx.gz.part")
+
+LOGGER = singer.get_logger()
+
+
+def digest(value):
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class ChangeIndex:
+    """
+    On-disk index of the rows of a FULL_TABLE stream from its previous sync,
+    used to emit only new and changed rows.
+
+    Each line of the index holds a 64-bit hash of a row's key_properties, a
+    64-bit hash of the whole transformed row and the key values, so rows
+    missing from a later sync can be reported as deleted. Only the hashes
+    are held in memory: lines of the new index are written out as rows
+    arrive, and key values are read back from the previous index when
+    deletions are reported. A key may have several rows, such as one reward
+    balance per type and unit, so every row is kept and each indexed row
+    matches at most one row of the new sync. Deletions are only reported for
+    keys with no rows left.
+
+    Every sync saves a new generation of the index next to the one it was
+    compared against, which is only removed by a later save. The caller
+    records the generation in the state, so until the target has committed
+    that state, the next sync is compared against the same generation
+    again. When rows were skipped because the sync resumed part way through
+    an export, entries for keys that were not seen are carried over and no
+    deletions are reported
+    """
+
+    def __init__(self, directory, name, key_properties, generation=None):
+        self.directory = directory
+        self.name = name
+        self.key_properties = list(key_properties)
+        self.generation = generation
+        self.keys = array.array("Q")
+        self.digests = array.array("Q")
+        self.matched = bytearray()
+        self.seen_keys = array.array("Q")
+        self.sorted_seen_keys = None
+        self.new_index = None
+        self.complete = True
+        self.load()
+
+    def path(self, generation):
+        return os.path.join(self.directory, "{}.{}.idx.gz".format(self.name, generation))
+
+    @property
+    def next_generation(self):
+        return (self.generation or 0) + 1
+
+    def read(self):
+        """Yield the (key, digest, values) entries of the generation being compared against"""
+
+        if self.generation is None or not os.path.exists(self.path(self.generation)):
+            return
+        with gzip.open(self.path(self.generation), "rt", encoding="utf-8") as index:
+            for line in index:
+                yield int(line[0:16], 16), int(line[17:33], 16), line[34:].rstrip("\n")
+
+    def load(self):
+        if self.generation is not None and not os.path.exists(self.path(self.generation)):
+            LOGGER.warning("Change index %s is missing, every row will be emitted",
+                           self.path(self.generation))
+        keys = array.array("Q")
+        digests = array.array("Q")
+        for key, row_digest, _ in self.read():
+            keys.append(key)
+            digests.append(row_digest)
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        self.keys = array.array("Q", (keys[i] for i in order))
+        self.digests = array.array("Q", (digests[i] for i in order))
+        self.matched = bytearray(len(self.keys))
+
+    def match(self, key, row_digest):
+        """Mark an unmatched indexed row with key and row_digest as matched, returning whether there was one"""
+
+        index = bisect.bisect_left(self.keys, key)
+        while index < len(self.keys) and self.keys[index] == key:
+            if self.digests[index] == row_digest and not self.matched[index]:
+                self.matched[index] = 1
+                return True
+            index += 1
+        return False
+
+    def open_new_index(self):
+        if self.new_index is None:
+            os.makedirs(self.directory or ".", exist_ok=True)
+            self.new_index = gzip.open(self.path(self.next_generation) + ".part", "wt",
+                                       encoding="utf-8", compresslevel=1)
+        return self.new_index
+
+    def write(self, key, row_digest, values):
+        self.open_new_index().write("{:016x} {:016x} {}\n".format(key, row_digest, values))
+
+    def seen(self, key):
+        if self.sorted_seen_keys is None:
+            self.sorted_seen_keys = array.array("Q", sorted(self.seen_keys))
+        index = bisect.bisect_left(self.sorted_seen_keys, key)
+        return index < len(self.sorted_seen_keys) and self.sorted_seen_keys[index] == key
+
+    def changed(self, record):
+        """Record record in the new index, returning whether it is new or changed"""
+
+        # JSON keeps None apart from the string "None"
+        values = json.dumps([record.get(prop) for prop in self.key_properties], default=str)
+        key = digest(values)
+        row_digest = digest(json.dumps(record, sort_keys=True, default=str))
+        self.seen_keys.append(key)
+        self.sorted_seen_keys = None
+        self.write(key, row_digest, values)
+        return not self.match(key, row_digest)
+
+    def mark_partial(self):
+        self.complete = False
+
+    def deleted(self):
+        """Yield the key_properties of every indexed key with no rows in this sync"""
+
+        if not self.complete:
+            return
+        reported = set()
+        for key, _, values in self.read():
+            if key not in reported and not self.seen(key):
+                reported.add(key)
+                yield dict(zip(self.key_properties, json.loads(values)))
+
+    def save(self):
+        """
+        Write the new generation of the index and return it. Generations other
+        than this one and the one it was compared against are removed
+        """
+
+        if not self.complete:
+            for key, row_digest, values in self.read():
+                if not self.seen(key):
+                    self.write(key, row_digest, values)
+        # A sync without rows still makes an empty generation
+        self.open_new_index().close()
+        self.new_index = None
+
+        generation = self.next_generation
+        os.replace(self.path(generation) + ".part", self.path(generation))
+        self.remove_stale({self.generation, generation})
+        return generation
+
+    def remove_stale(self, keep):
+        prefix = self.name + "."
+        for filename in os.listdir(self.directory or "."):
+            if not filename.startswith(prefix):
+                continue
+            for suffix in INDEX_SUFFIXES:
+                generation = filename[len(prefix):-len(suffix)]
+                if filename.endswith(suffix) and generation.isdigit() and int(generation) not in keep:
+                    os.remove(os.path.join(self.directory or ".", filename))
+                    break
@@ -0,0 +1,226 @@
+import io
+import time
+
+import backoff
+import requests
+import singer
+import urllib3
+from requests.adapters import HTTPAdapter
+
+BASE_URL = "https://app.referralsaasquatch.com/api/v1/{}"
+MAX_TRIES = 5
+CONNECT_TIMEOUT = 10
+REQUEST_TIMEOUT = 300
+POOL_CONNECTIONS = 4
+POOL_MAXSIZE = 10
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+TEXT_BUFFER_SIZE = 1024 * 1024
+RESUMABLE_ERRORS = (requests.exceptions.ChunkedEncodingError,
+                    requests.exceptions.ConnectionError)
+
+LOGGER = singer.get_logger()
+
+
+def is_fatal(exc):
+    """
+    Client errors other than rate limiting will not succeed on retry
+    """
+
+    response = getattr(exc, "response", None)
+    return (response is not None
+            and 400 <= response.status_code < 500
+            and response.status_code != 429)
+
+
+def is_resendable(exc):
+    """
+    Creating an export is not idempotent, so a POST is only sent again when
+    the server cannot have acted on it: it was rate limited, or the
+    connection failed before the request went out
+    """
+
+    response = getattr(exc, "response", None)
+    if response is not None:
+        return response.status_code == 429
+    if isinstance(exc, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(exc.args[0], "reason", None) if exc.args else None
+    return (isinstance(exc, requests.exceptions.ConnectionError)
+            and isinstance(reason, urllib3.exceptions.NewConnectionError))
+
+
+def create_session(pool_maxsize=POOL_MAXSIZE):
+    """
+    Return a keep-alive session whose connection pool is large enough for
+    concurrent export polls and downloads. Retries are handled by
+    SaaSquatchClient so urllib3's own retries are disabled
+    """
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS,
+                          pool_maxsize=pool_maxsize,
+                          max_retries=0)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"Content-Type": "application/json"})
+    return session
+
+
+class SaaSquatchClient:
+    """
+    Shared HTTP client for the export API. Every call goes through one pooled
+    session with the same auth, headers, timeouts and retry policy.
+    Connection errors, timeouts, 429s and 5xx responses are retried with
+    exponential backoff; other 4xx responses are raised immediately. POSTs
+    are only retried when is_resendable allows it
+    """
+
+    def __init__(self, config, session=None):
+        self.config = config
+        self.session = session if session is not None else create_session()
+        self.send = self.retrying(is_fatal)
+        self.send_unsafe = self.retrying(lambda exc: not is_resendable(exc))
+
+    def retrying(self, giveup):
+        return backoff.on_exception(backoff.expo,
+                                    requests.exceptions.RequestException,
+                                    max_tries=MAX_TRIES,
+                                    giveup=giveup,
+                                    factor=2)(self.send_once)
+
+    @property
+    def base_url(self):
+        return self.config.get("base_url", BASE_URL).format(self.config["tenant_alias"])
+
+    @property
+    def timeout(self):
+        return (float(self.config.get("connect_timeout", CONNECT_TIMEOUT)),
+                float(self.config.get("request_timeout", REQUEST_TIMEOUT)))
+
+    def send_once(self, method, path, **kwargs):
+        headers = kwargs.pop("headers", {})
+        if "user_agent" in self.config:
+            headers["User-Agent"] = self.config["user_agent"]
+
+        resp = self.session.request(method,
+                                    self.base_url + path,
+                                    auth=("", self.config["api_key"]),
+                                    headers=headers,
+                                    timeout=self.timeout,
+                                    **kwargs)
+        try:
+            resp.raise_for_status()
+        except requests.exceptions.HTTPError:
+            resp.close()
+            raise
+        return resp
+
+    def get(self, path, **kwargs):
+        return self.send("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.send_unsafe("POST", path, **kwargs)
+
+
+class ResumableDownload:
+    """
+    Response-like wrapper around a streamed download. If the connection
+    drops part way through, the download is requested again with a Range
+    header starting at the last byte received. Servers that ignore the Range
+    header send the whole body again, in which case the bytes already
+    received are skipped, so callers always see one contiguous byte stream.
+
+    The session's default Accept-Encoding lets the first response arrive
+    gzip or deflate encoded, which iter_content decodes as it streams;
+    bytes_transferred counts the bytes received before decoding
+    """
+
+    def __init__(self, client, path, max_resumes=MAX_TRIES, offset=0):
+        self.client = client
+        self.path = path
+        self.max_resumes = max_resumes
+        self.bytes_read = offset
+        self.bytes_transferred = 0
+        self.resumes = 0
+
+    def open(self):
+        if not self.bytes_read:
+            return self.client.get(self.path, stream=True)
+        # Offsets count decoded bytes, so ask for the identity encoding to
+        # make them line up with the byte range the server sends back
+        headers = {"Range": "bytes={}-".format(self.bytes_read),
+                   "Accept-Encoding": "identity"}
+        return self.client.get(self.path, stream=True, headers=headers)
+
+    def iter_body(self, resp, chunk_size):
+        # raw.tell() counts the bytes read off the wire for this response
+        transferred = self.bytes_transferred
+        for chunk in resp.iter_content(chunk_size=chunk_size):
+            self.bytes_transferred = transferred + resp.raw.tell()
+            yield chunk
+        self.bytes_transferred = transferred + resp.raw.tell()
+
+    def iter_content(self, chunk_size=1, decode_unicode=False):
+        while True:
+            with self.open() as resp:
+                skip = self.bytes_read if resp.status_code != 206 else 0
+                try:
+                    for chunk in self.iter_body(resp, chunk_size):
+                        if skip:
+                            if len(chunk) <= skip:
+                                skip -= len(chunk)
+                                continue
+                            chunk = chunk[skip:]
+                            skip = 0
+                        self.bytes_read += len(chunk)
+                        yield chunk
+                    LOGGER.info("Downloaded %s bytes of %s, %s transferred",
+                                self.bytes_read, self.path, self.bytes_transferred)
+                    return
+                except RESUMABLE_ERRORS as exc:
+                    if self.resumes >= self.max_resumes:
+                        raise
+                    self.resumes += 1
+                    LOGGER.warning("Download of %s interrupted after %s bytes (%s), resuming",
+                                   self.path, self.bytes_read, exc)
+            time.sleep(2 ** self.resumes)
+
+
+class ChunkIO(io.RawIOBase):
+    """
+    Read-only binary file over an iterator of byte chunks, such as
+    Response.iter_content, so the standard io buffering and decoding layers
+    can sit on top of a streamed download
+    """
+
+    def __init__(self, chunks):
+        super().__init__()
+        self.chunks = iter(chunks)
+        self.pending = memoryview(b"")
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.pending:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                return 0
+            self.pending = memoryview(chunk)
+
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+
+def open_text(chunks, encoding="utf-8"):
+    """
+    Return a text stream that decodes chunks incrementally. newline='' leaves
+    line endings untouched, which is what csv.reader needs to keep newlines
+    inside quoted fields
+    """
+
+    return io.TextIOWrapper(io.BufferedReader(ChunkIO(chunks), buffer_size=TEXT_BUFFER_SIZE),
+                            encoding=encoding,
+                            newline="")
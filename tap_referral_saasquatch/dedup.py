@@ -0,0 +1,54 @@
+import array
+import bisect
+import hashlib
+import heapq
+import json
+
+PENDING_MIN_KEYS = 65536
+
+
+class KeyFilter:
+    """
+    Remembers the key_properties of every record seen during a sync so
+    records emitted again by overlapping exports can be dropped.
+
+    Each key is stored as a 64-bit hash, so with tens of millions of keys the
+    chance of two distinct keys colliding stays in the order of one in a
+    million. Keys live in a sorted array of unsigned 64-bit integers, eight
+    bytes per key, with recent keys held in a small set that is merged into
+    the array once it grows past a quarter of its size
+    """
+
+    def __init__(self, key_properties):
+        self.key_properties = list(key_properties)
+        self.keys = array.array("Q")
+        self.pending = set()
+
+    def __len__(self):
+        return len(self.keys) + len(self.pending)
+
+    def key(self, record):
+        # JSON keeps None apart from the string "None"
+        values = json.dumps([record.get(prop) for prop in self.key_properties], default=str)
+        return int.from_bytes(hashlib.blake2b(values.encode("utf-8"), digest_size=8).digest(), "little")
+
+    def __contains__(self, key):
+        if key in self.pending:
+            return True
+        index = bisect.bisect_left(self.keys, key)
+        return index < len(self.keys) and self.keys[index] == key
+
+    def add(self, record):
+        """Record the key of record, returning False if it was already seen"""
+
+        key = self.key(record)
+        if key in self:
+            return False
+        self.pending.add(key)
+        if len(self.pending) >= max(PENDING_MIN_KEYS, len(self.keys) // 4):
+            self.merge()
+        return True
+
+    def merge(self):
+        self.keys = array.array("Q", heapq.merge(self.keys, sorted(self.pending)))
+        self.pending.clear()
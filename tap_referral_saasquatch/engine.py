@@ -0,0 +1,296 @@
+import asyncio
+import datetime
+import email.utils
+import random
+import threading
+import time
+
+import requests
+import singer
+from singer import metrics, utils
+
+from tap_referral_saasquatch.client import DOWNLOAD_CHUNK_SIZE, ResumableDownload
+
+entity_export_types = {
+    "users": "USER",
+    "reward_balances": "REWARD_BALANCE",
+    "referrals": "REFERRAL",
+}
+EXPORT_POLL_INITIAL_INTERVAL = 1
+EXPORT_POLL_MAX_INTERVAL = 60
+EXPORT_TIMEOUT = 3600
+
+LOGGER = singer.get_logger()
+
+
+def parse_retry_after(value):
+    """
+    Return the number of seconds requested by a Retry-After header, which
+    may be either a delay in seconds or an HTTP date
+    """
+
+    if not value:
+        return None
+
+    try:
+        return max(float(value), 0)
+    except (TypeError, ValueError):
+        pass
+
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=datetime.UTC)
+    return max((retry_at - datetime.datetime.now(datetime.UTC)).total_seconds(), 0)
+
+
+def poll_intervals(max_interval):
+    """
+    Yield exponentially growing poll delays, starting at
+    EXPORT_POLL_INITIAL_INTERVAL and capped at max_interval, with half of each
+    delay randomized so concurrent polls do not line up
+    """
+
+    interval = min(EXPORT_POLL_INITIAL_INTERVAL, max_interval)
+    while True:
+        yield interval / 2 + random.uniform(0, interval / 2)
+        interval = min(interval * 2, max_interval)
+
+
+async def bounded(limit, coroutine):
+    """Await coroutine while holding the semaphore limit"""
+
+    async with limit:
+        return await coroutine
+
+
+def iter_async(iterator):
+    """
+    Iterate over an async iterator from synchronous code, on an event loop
+    of its own
+    """
+
+    loop = asyncio.new_event_loop()
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(anext(iterator))
+            except StopAsyncIteration:
+                return
+    finally:
+        loop.run_until_complete(iterator.aclose())
+        loop.close()
+
+
+async def wait_or_cancel(delay, cancelled=None):
+    """
+    Sleep for delay seconds, returning early once cancelled is set. cancelled
+    may be a threading.Event or an asyncio.Event
+    """
+
+    if cancelled is None:
+        await asyncio.sleep(delay)
+    elif asyncio.iscoroutinefunction(cancelled.wait):
+        try:
+            await asyncio.wait_for(cancelled.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+    else:
+        await asyncio.to_thread(cancelled.wait, delay)
+
+
+class ClientTransport:
+    """
+    Transport running a SaaSquatchClient's blocking calls on worker threads,
+    so the engine's coroutines never block the event loop. Anything with the
+    same methods can stand in for it, such as an in-memory fake in tests
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def url(self, path):
+        return self.client.base_url + path
+
+    async def get_json(self, path):
+        resp = await asyncio.to_thread(self.client.get, path)
+        return resp.json(), resp.headers
+
+    async def post_json(self, path, body):
+        resp = await asyncio.to_thread(self.client.post, path, json=body)
+        return resp.json(), resp.headers
+
+    async def stream(self, path, offset=0, chunk_size=DOWNLOAD_CHUNK_SIZE):
+        chunks = ResumableDownload(self.client, path, offset=offset).iter_content(chunk_size=chunk_size)
+        while True:
+            chunk = await asyncio.to_thread(next, chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+
+
+class EventLoopThread:
+    """
+    Event loop running on a daemon thread, so synchronous code can start
+    engine coroutines and carry on while they run
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="export-engine", daemon=True)
+        self.thread.start()
+
+    def submit(self, coroutine):
+        """Schedule coroutine on the loop and return a concurrent.futures.Future for its result"""
+
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    async def cancel_pending(self):
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def close(self):
+        """Cancel whatever is still running and stop the loop"""
+
+        self.submit(self.cancel_pending()).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+class ExportEngine:
+    """
+    Runs the export lifecycle, create, poll until complete and download, as
+    coroutines over a transport, so any number of exports can be in flight
+    on one thread. Created exports are recorded in cache, and time spent is
+    reported to profiler, when they are given
+    """
+
+    def __init__(self, config, transport, cache=None, profiler=None):
+        self.config = config
+        self.transport = transport
+        self.cache = cache
+        self.profiler = profiler
+
+    def record(self, entity, stage, started):
+        if self.profiler is not None:
+            self.profiler.add(entity, stage, time.perf_counter() - started)
+
+    async def create_export(self, entity, since, until=None):
+        requested_at = datetime.datetime.now(datetime.UTC)
+        data = {
+            "type": entity_export_types[entity],
+            "format": "CSV",
+            "name": "Stitch Streams {}:{}".format(entity, requested_at),
+            "params": {
+                "createdOrUpdatedSince": since,
+            },
+        }
+        if until is not None:
+            # Only windowed backfills pass until, and those require the
+            # parameter to be configured
+            data["params"][self.config['export_window_end_param']] = until
+
+        url = self.transport.url("/export")
+        LOGGER.info("POST {} body={}".format(url, data))
+        started = time.perf_counter()
+        try:
+            result, _ = await self.transport.post_json("/export", data)
+        except requests.exceptions.HTTPError as exc:
+            LOGGER.critical("Error submitting request for export: POST {}: [{} - {}]"
+                            .format(url, exc.response.status_code, exc.response.content))
+            raise
+        finally:
+            self.record(entity, "request", started)
+
+        if 'id' not in result:
+            raise Exception("Request to create {} export failed: {}".format(entity, result))
+        if self.cache is not None:
+            self.cache.put(entity, since, until, result['id'], until or utils.strftime(requested_at))
+        return result['id']
+
+    async def export_status(self, export_id):
+        result, headers = await self.transport.get_json("/export/{}".format(export_id))
+        return result['status'] == 'COMPLETED', parse_retry_after(headers.get('Retry-After'))
+
+    async def wait_for_export(self, entity, export_id, cancelled=None):
+        timeout = float(self.config.get('export_timeout', EXPORT_TIMEOUT))
+        max_interval = float(self.config.get('export_poll_max_interval', EXPORT_POLL_MAX_INTERVAL))
+
+        started = time.monotonic()
+        profile_started = time.perf_counter()
+        polls = 0
+        intervals = poll_intervals(max_interval)
+        try:
+            with metrics.job_timer('{}_export'.format(entity)):
+                while True:
+                    if cancelled is not None and cancelled.is_set():
+                        raise Exception("{} export cancelled".format(entity))
+
+                    ready, retry_after = await self.export_status(export_id)
+                    polls += 1
+                    waited = time.monotonic() - started
+                    if ready:
+                        LOGGER.info("{}: Export {} ready after {:.1f} seconds and {} polls"
+                                    .format(entity, export_id, waited, polls))
+                        return
+
+                    delay = next(intervals) if retry_after is None else retry_after
+                    if waited + delay > timeout:
+                        raise Exception("{} export took over {} seconds to complete. Aborting."
+                                        .format(entity, int(timeout)))
+
+                    await wait_or_cancel(delay, cancelled)
+        finally:
+            self.record(entity, "wait", profile_started)
+            if self.profiler is not None:
+                self.profiler.count(entity, "polls", polls)
+
+    async def request_export(self, entity, since, until=None, cancelled=None):
+        export_id = await self.create_export(entity, since, until)
+        await self.wait_for_export(entity, export_id, cancelled=cancelled)
+        return export_id
+
+    async def cached_export(self, entity, since, until=None, cancelled=None):
+        """
+        Return (export_start, export_id) of the export recorded in the cache
+        for the range once it is ready, or None if there is none or it is no
+        longer available
+        """
+
+        cached = self.cache.get(entity, since, until) if self.cache is not None else None
+        if cached is None:
+            return None
+        try:
+            await self.wait_for_export(entity, cached['id'], cancelled=cancelled)
+        except requests.exceptions.HTTPError:
+            LOGGER.info("{}: Cached export {} is no longer available".format(entity, cached['id']))
+            self.cache.remove(entity, since, until)
+            return None
+        LOGGER.info("{}: Reusing cached export {}".format(entity, cached['id']))
+        return cached['export_start'], cached['id']
+
+    async def ensure_export(self, entity, since, until=None, cancelled=None):
+        """
+        Return (export_start, export_id) of a ready export of the range,
+        reusing the cached one when possible. export_start is where the
+        bookmark moves once the export is synced
+        """
+
+        cached = await self.cached_export(entity, since, until, cancelled=cancelled)
+        if cached is not None:
+            return cached
+
+        LOGGER.info("{}: Requesting export".format(entity))
+        # A windowed export only covers changes up to its end, so that is
+        # where the bookmark moves once it is synced
+        export_start = until or utils.strftime(datetime.datetime.now(datetime.UTC))
+        return export_start, await self.request_export(entity, since, until, cancelled=cancelled)
+
+    def download(self, export_id, offset=0, chunk_size=DOWNLOAD_CHUNK_SIZE):
+        return self.transport.stream("/export/{}/download".format(export_id),
+                                     offset=offset, chunk_size=chunk_size)
@@ -0,0 +1,61 @@
+import json
+import sys
+import time
+
+from singer import messages
+
+OUTPUT_BUFFER_SIZE = 1024 * 1024
+OUTPUT_FLUSH_INTERVAL = 1.0
+
+
+class RecordWriter:
+    """
+    Buffers RECORD messages and writes them to stdout in large blocks.
+
+    Records are serialized with one reused JSON encoder and a per-stream
+    message prefix, producing the same lines singer.write_record would. The
+    buffer is written out once it holds max_buffer_size characters or
+    flush_interval seconds have passed since the last flush, and must be
+    flushed before any other message is written so RECORD, SCHEMA and STATE
+    messages keep their order
+    """
+
+    def __init__(self, max_buffer_size=OUTPUT_BUFFER_SIZE, flush_interval=OUTPUT_FLUSH_INTERVAL):
+        self.max_buffer_size = max_buffer_size
+        self.flush_interval = flush_interval
+        self.encode = json.JSONEncoder(ensure_ascii=True, allow_nan=False).encode
+        self.prefixes = {}
+        self.buffer = []
+        self.buffered = 0
+        self.last_flush = time.monotonic()
+
+    def configure(self, config):
+        self.max_buffer_size = int(config.get('output_buffer_size', OUTPUT_BUFFER_SIZE))
+        self.flush_interval = float(config.get('output_flush_interval', OUTPUT_FLUSH_INTERVAL))
+
+    def format_record(self, stream_name, record):
+        prefix = self.prefixes.get(stream_name)
+        if prefix is None:
+            prefix = '{"type": "RECORD", "stream": ' + self.encode(stream_name) + ', "record": '
+            self.prefixes[stream_name] = prefix
+        try:
+            return prefix + self.encode(record) + '}\n'
+        except TypeError:
+            # Types the stdlib encoder does not handle, such as Decimal
+            return messages.format_message(messages.RecordMessage(stream=stream_name, record=record)) + '\n'
+
+    def write_record(self, stream_name, record):
+        line = self.format_record(stream_name, record)
+        self.buffer.append(line)
+        self.buffered += len(line)
+        if (self.buffered >= self.max_buffer_size
+                or time.monotonic() - self.last_flush >= self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            sys.stdout.write(''.join(self.buffer))
+            self.buffer.clear()
+            self.buffered = 0
+            sys.stdout.flush()
+        self.last_flush = time.monotonic()
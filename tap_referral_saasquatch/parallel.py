@@ -0,0 +1,99 @@
+import collections
+import csv
+import io
+import mmap
+import os
+
+import singer
+
+PARSE_CHUNK_BYTES = 16 * 1024 * 1024
+
+
+def row_ranges(path, chunk_bytes):
+    """
+    Split a spooled CSV export into byte ranges of roughly chunk_bytes that
+    each end on a row boundary, returning the range holding the header and
+    an iterator over the ranges after it.
+
+    A newline ends a row only outside quoted fields, which is when an even
+    number of quote characters precede it since the start of the range;
+    escaped quotes are doubled and leave the parity unchanged
+    """
+
+    size = os.path.getsize(path)
+    if size == 0:
+        return None, iter(())
+
+    f = open(path, "rb")  # pylint: disable=consider-using-with
+    view = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    f.close()
+
+    def next_boundary(start, target):
+        quotes = view[start:target].count(b'"')
+        cursor = target
+        while True:
+            newline = view.find(b"\n", cursor)
+            if newline == -1:
+                return size
+            quotes += view[cursor:newline].count(b'"')
+            if quotes % 2 == 0:
+                return newline + 1
+            cursor = newline + 1
+
+    def ranges(start):
+        try:
+            while start < size:
+                end = size if start + chunk_bytes >= size else next_boundary(start, start + chunk_bytes)
+                yield start, end
+                start = end
+        finally:
+            view.close()
+
+    header_end = next_boundary(0, 0)
+    return (0, header_end), ranges(header_end)
+
+
+def read_range(path, start, end):
+    with open(path, "rb") as f:
+        f.seek(start)
+        return f.read(end - start).decode("utf-8")
+
+
+def read_header(path, header_range):
+    return next(csv.reader(io.StringIO(read_range(path, *header_range), newline="")))
+
+
+def transform_chunk(path, start, end, entity, header, fields, schema, mdata):
+    """
+    Parse and transform the rows in one byte range of a spooled export.
+    Runs in a worker process
+    """
+
+    # Imported here rather than at module level because the package imports
+    # this module
+    from tap_referral_saasquatch import column_projection, project_rows, transform_records
+
+    linereader = csv.reader(io.StringIO(read_range(path, start, end), newline=""))
+    names, project = column_projection(header, fields)
+    rows = project_rows(linereader, project, header, names)
+    with singer.Transformer() as transformer:
+        return list(transform_records(entity, names, rows, schema, mdata, transformer))
+
+
+def iter_ordered(executor, function, calls, window):
+    """
+    Submit function(*args) for each args in calls to executor, keeping at
+    most window calls in flight, and yield their results in submission order
+    """
+
+    pending = collections.deque()
+    try:
+        for args in calls:
+            pending.append(executor.submit(function, *args))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
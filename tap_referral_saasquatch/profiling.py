@@ -0,0 +1,139 @@
+import collections
+import contextlib
+import threading
+import time
+
+import singer
+from singer import metrics
+
+LOGGER = singer.get_logger()
+STAGES = ["request", "wait", "download", "parse", "transform", "write"]
+
+_DONE = object()
+
+
+class StageProfiler:
+    """
+    Accumulates per-stream time spent in each stage of a sync, along with
+    downloaded bytes, rows and export status polls.
+
+    Stages nest: the time of a stage excludes time spent in stages started
+    while it was running on the same thread, so iterators wrapped around each
+    other (download inside parse inside transform) each report only their own
+    work. Nothing is measured unless profile_stages is enabled
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.seconds = collections.defaultdict(lambda: collections.defaultdict(float))
+        self.counts = collections.defaultdict(lambda: collections.defaultdict(int))
+        self.wall = collections.defaultdict(float)
+
+    def configure(self, config):
+        self.enabled = str(config.get('profile_stages', False)).lower() == 'true'
+        self.seconds.clear()
+        self.counts.clear()
+        self.wall.clear()
+
+    def start(self):
+        stack = getattr(self.local, "stack", None)
+        if stack is None:
+            stack = self.local.stack = []
+        stack.append(0.0)
+        return time.perf_counter()
+
+    def stop(self, entity, stage, started):
+        elapsed = time.perf_counter() - started
+        stack = self.local.stack
+        nested = stack.pop()
+        if stack:
+            stack[-1] += elapsed
+        with self.lock:
+            self.seconds[entity][stage] += elapsed - nested
+
+    def count(self, entity, name, amount=1):
+        if self.enabled:
+            with self.lock:
+                self.counts[entity][name] += amount
+
+    def add(self, entity, stage, seconds):
+        """
+        Count seconds towards stage outside of the nesting stack, for
+        coroutines that interleave on one thread
+        """
+
+        if self.enabled:
+            with self.lock:
+                self.seconds[entity][stage] += seconds
+
+    def add_wall_time(self, entity, seconds):
+        if self.enabled:
+            with self.lock:
+                self.wall[entity] += seconds
+
+    @contextlib.contextmanager
+    def stage(self, entity, stage):
+        if not self.enabled:
+            yield
+            return
+        started = self.start()
+        try:
+            yield
+        finally:
+            self.stop(entity, stage, started)
+
+    def timed_iter(self, entity, stage, iterable, counter=None):
+        """
+        Return iterable with the time spent producing each item counted
+        towards stage, and the len() of each item added to counter if given
+        """
+
+        if not self.enabled:
+            return iterable
+        return self.iter_timed(entity, stage, iter(iterable), counter)
+
+    def iter_timed(self, entity, stage, iterator, counter):
+        while True:
+            started = self.start()
+            item = next(iterator, _DONE)
+            self.stop(entity, stage, started)
+            if item is _DONE:
+                return
+            if counter is not None:
+                self.count(entity, counter, len(item))
+            yield item
+
+    def timed_call(self, entity, stage, function):
+        if not self.enabled:
+            return function
+
+        def timed(*args, **kwargs):
+            started = self.start()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.stop(entity, stage, started)
+        return timed
+
+    def emit(self):
+        """Log the collected numbers as Singer metrics, then a summary per stream"""
+
+        if not self.enabled:
+            return
+        for entity in sorted(set(self.seconds) | set(self.counts)):
+            for stage in STAGES:
+                if stage in self.seconds[entity]:
+                    metrics.log(LOGGER, metrics.Point("timer", "stage_duration", self.seconds[entity][stage],
+                                                      {"stream": entity, "stage": stage}))
+            for name, value in sorted(self.counts[entity].items()):
+                metrics.log(LOGGER, metrics.Point("counter", name, value, {"stream": entity}))
+
+            rows = self.counts[entity]["rows"]
+            wall = self.wall[entity]
+            LOGGER.info("{}: {} rows in {:.1f}s ({:.0f} rows/sec), {} bytes downloaded, {} status polls; {}"
+                        .format(entity, rows, wall, rows / wall if wall else 0,
+                                self.counts[entity]["bytes"], self.counts[entity]["polls"],
+                                ", ".join("{} {:.1f}s".format(stage, self.seconds[entity][stage])
+                                          for stage in STAGES if stage in self.seconds[entity])))
@@ -0,0 +1,69 @@
+import mmap
+import os
+
+import singer
+
+SPOOL_CHUNK_SIZE = 1024 * 1024
+SPOOL_BUFFER_SIZE = 8 * 1024 * 1024
+
+LOGGER = singer.get_logger()
+
+
+def spool_path(spool_dir, tenant_alias, export_id):
+    return os.path.join(spool_dir, "{}-{}.csv".format(tenant_alias, export_id))
+
+
+def partial_size(path):
+    """
+    Return how many bytes of an interrupted spool are already on disk
+    """
+
+    try:
+        return os.path.getsize(path + ".part")
+    except OSError:
+        return 0
+
+
+def spool_download(chunks, path):
+    """
+    Write downloaded chunks to path in large buffered writes. Data lands in a
+    .part file that is only renamed once the download completes, so an
+    existing path is always a complete export and an existing .part file can
+    be resumed from its size
+    """
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    part = path + ".part"
+    with open(part, "ab", buffering=SPOOL_BUFFER_SIZE) as spool:
+        for chunk in chunks:
+            spool.write(chunk)
+    os.replace(part, path)
+
+
+def remove_spool(path):
+    """
+    Remove a spool and its partial download, returning whether there was
+    anything to remove
+    """
+
+    removed = False
+    for spool in (path, path + ".part"):
+        try:
+            os.remove(spool)
+            removed = True
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+def iter_spooled_lines(path):
+    """
+    Yield the lines of a spooled export, with their line endings, from a
+    read-only memory map of the file
+    """
+
+    with open(path, "rb") as spool:
+        if os.fstat(spool.fileno()).st_size == 0:
+            return
+        with mmap.mmap(spool.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            yield from iter(view.readline, b"")
@@ -0,0 +1,321 @@
+import datetime
+import functools
+
+from singer import metadata, utils
+from singer.transform import Error, SchemaMismatch, string_to_datetime
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+MILLIS_PER_DAY = 86400000
+# transform_timestamp goes through a float number of seconds, which only
+# resolves every millisecond exactly to the microsecond up to around 2106.
+# Values outside this range are formatted by the fallback instead.
+FAST_TIMESTAMP_MAX_MILLIS = 4102444800000  # 2100-01-01T00:00:00Z
+NUMPY_MIN_BATCH = 64
+
+
+def transform_timestamp(value):
+    if not value:
+        return None
+
+    return utils.strftime(datetime.datetime.fromtimestamp(int(value) * 0.001, tz=datetime.UTC))
+
+
+@functools.lru_cache(maxsize=65536)
+def day_prefix(days):
+    return (datetime.date(1970, 1, 1) + datetime.timedelta(days=days)).isoformat() + "T"
+
+
+def format_epoch_millis(millis):
+    days, millis_of_day = divmod(millis, MILLIS_PER_DAY)
+    seconds, millis = divmod(millis_of_day, 1000)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    return "%s%02d:%02d:%02d.%03d000Z" % (day_prefix(days), hours, minutes, seconds, millis)
+
+
+def format_epoch_millis_batch(millis):
+    if numpy is not None and len(millis) >= NUMPY_MIN_BATCH:
+        stamps = numpy.array(millis, dtype=numpy.int64).astype("datetime64[ms]")
+        return [stamp + "Z" for stamp in numpy.datetime_as_string(stamps, unit="us").tolist()]
+    return [format_epoch_millis(value) for value in millis]
+
+
+def transform_timestamps(values, fallback=transform_timestamp):
+    """
+    Convert a column of epoch-millisecond values at once, producing exactly
+    what transform_timestamp produces for each value. Values in the common
+    range are formatted with NumPy when it is installed, or with a per-day
+    cached formatter otherwise; anything else is passed to fallback
+    """
+
+    results = [None] * len(values)
+    fast_indexes = []
+    fast_millis = []
+    for index, value in enumerate(values):
+        if not value:
+            continue
+        try:
+            millis = int(value)
+        except (TypeError, ValueError):
+            millis = -1
+        if 0 <= millis < FAST_TIMESTAMP_MAX_MILLIS:
+            fast_indexes.append(index)
+            fast_millis.append(millis)
+        else:
+            results[index] = fallback(value)
+
+    for index, formatted in zip(fast_indexes, format_epoch_millis_batch(fast_millis)):
+        results[index] = formatted
+    return results
+
+
+TRANSFORMS = {
+    "users": {
+        "dateCreated": transform_timestamp,
+    },
+    "reward_balances": {
+        "amount": int,
+    },
+    "referrals": {
+        "dateReferralStarted": transform_timestamp,
+        "dateReferralPaid": transform_timestamp,
+        "dateReferralEnded": transform_timestamp,
+        "dateModerated": transform_timestamp,
+        "dateConverted": transform_timestamp,
+    },
+}
+
+
+def column_transforms(entity, names):
+    """
+    Return the TRANSFORMS of entity as (column index, transform) pairs for
+    rows given as sequences of values laid out like names
+    """
+
+    transforms = TRANSFORMS.get(entity, {})
+    return [(index, transforms[name]) for index, name in enumerate(names) if name in transforms]
+
+
+def transform_values(values, transforms):
+    """
+    Apply column_transforms to a row of values ahead of schema validation.
+    Empty values become None; values a transform rejects are left as they
+    are for the schema to reject
+    """
+
+    values = list(values)
+    for index, transform in transforms:
+        if index >= len(values):
+            continue
+        value = values[index]
+        if value == "":
+            values[index] = None
+            continue
+        try:
+            values[index] = transform(value)
+        except (OverflowError, OSError, ValueError):
+            pass
+    return values
+
+
+def transform_row(entity, row):
+    """Apply TRANSFORMS to a row given as a dict, the same way sync_export applies them by column"""
+
+    names = list(row)
+    return dict(zip(names, transform_values(row.values(), column_transforms(entity, names))))
+
+
+def transform_field(entity, field, value):
+    return transform_row(entity, {field: value})[field]
+
+
+class ConversionError(ValueError):
+    pass
+
+
+def convert_string(value):
+    if value is None:
+        return None
+    return str(value)
+
+
+def convert_integer(value):
+    if isinstance(value, str):
+        value = value.replace(",", "")
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        if value is None or value == "":
+            return None
+        raise ConversionError(value)
+
+
+def convert_date_time(value):
+    if value is None or value == "":
+        return None
+    converted = string_to_datetime(value)
+    if converted is None:
+        raise ConversionError(value)
+    return converted
+
+
+def convert_timestamp(value):
+    if value is None or value == "":
+        return None
+    try:
+        return transform_timestamp(value)
+    except (OverflowError, OSError, ValueError):
+        return convert_date_time(value)
+
+
+def not_null(converter):
+    def convert(value):
+        converted = converter(value)
+        if converted is None:
+            raise ConversionError(value)
+        return converted
+    return convert
+
+
+def field_converter(entity, field, field_schema):
+    """
+    Return a single-argument callable that converts a raw CSV value the same
+    way singer.Transformer would for field_schema, or None if the schema uses
+    types that are not handled here
+    """
+
+    if "type" not in field_schema:
+        return lambda value: value
+
+    types = field_schema["type"]
+    if not isinstance(types, list):
+        types = [types]
+    non_null_types = [typ for typ in types if typ != "null"]
+    if len(non_null_types) != 1:
+        return None
+
+    typ = non_null_types[0]
+    if typ == "string" and field_schema.get("format") == "date-time":
+        if TRANSFORMS.get(entity, {}).get(field) is transform_timestamp:
+            converter = convert_timestamp
+        else:
+            converter = convert_date_time
+    elif typ == "string" and "format" not in field_schema:
+        converter = convert_string
+    elif typ == "integer":
+        converter = convert_integer
+    else:
+        return None
+
+    if "null" not in types:
+        converter = not_null(converter)
+    return converter
+
+
+def identity(value):
+    return value
+
+
+class CompiledTransformer:
+    """
+    Per-stream replacement for singer.Transformer on flat CSV rows. Field
+    selection and type coercion are resolved once from the catalog schema,
+    metadata and TRANSFORMS, leaving a list of (field, converter) pairs to
+    apply to each row
+    """
+
+    def __init__(self, converters, schema):
+        self.converters = converters
+        self.schema = schema
+        # Timestamp columns are left raw by the row pass of
+        # transform_values_batch and converted a whole column at a time
+        # afterwards
+        self.timestamp_fields = [field for field, converter in converters
+                                 if converter is convert_timestamp]
+        self.batch_converters = [(field, identity if converter is convert_timestamp else converter)
+                                 for field, converter in converters]
+
+    def mismatch(self, field, value):
+        return SchemaMismatch([Error([field], value, self.schema["properties"][field])])
+
+    def bind(self, names):
+        """
+        Return the batch converters as (field, index, converter) for rows
+        given as sequences of values laid out like names
+        """
+
+        positions = {name: index for index, name in enumerate(names)}
+        return [(field, positions[field], converter) for field, converter in self.batch_converters
+                if field in positions]
+
+    def convert_values(self, values, columns):
+        record = {}
+        for field, index, converter in columns:
+            try:
+                value = values[index]
+            except IndexError:
+                # Short rows are missing their trailing columns
+                continue
+            try:
+                record[field] = converter(value)
+            except ConversionError:
+                raise self.mismatch(field, value)
+        return record
+
+    def transform_values_batch(self, names, rows):
+        """Transform rows given as sequences of values laid out like names"""
+
+        columns = self.bind(names)
+        return self.convert_timestamps([self.convert_values(values, columns) for values in rows])
+
+    def convert_timestamps(self, records):
+        for field in self.timestamp_fields:
+            present = [record for record in records if field in record]
+            try:
+                converted = transform_timestamps([record[field] for record in present],
+                                                 fallback=convert_timestamp)
+            except ConversionError as err:
+                raise self.mismatch(field, err.args[0])
+            for record, value in zip(present, converted):
+                record[field] = value
+        return records
+
+
+def field_selected(mdata, field):
+    breadcrumb = ("properties", field)
+    if metadata.get(mdata, breadcrumb, "inclusion") == "automatic":
+        return True
+    return not (metadata.get(mdata, breadcrumb, "selected") is False
+                or metadata.get(mdata, breadcrumb, "inclusion") == "unsupported")
+
+
+def selected_fields(schema, mdata):
+    """Return the schema properties that end up in emitted records"""
+
+    return [field for field in schema.get("properties", {}) if field_selected(mdata, field)]
+
+
+def compile_transformer(entity, schema, mdata):
+    """
+    Build a CompiledTransformer for a flat stream schema, or return None when
+    the schema needs the general singer.Transformer
+    """
+
+    if schema.get("type") not in ("object", ["object"], ["null", "object"], ["object", "null"]):
+        return None
+
+    converters = []
+    for field, field_schema in schema.get("properties", {}).items():
+        if not field_selected(mdata, field):
+            continue
+
+        converter = field_converter(entity, field, field_schema)
+        if converter is None:
+            return None
+        converters.append((field, converter))
+
+    return CompiledTransformer(converters, schema)
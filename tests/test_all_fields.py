@@ -1,5 +1,5 @@
 import unittest
-from unittest.mock import patch
+from unittest.mock import AsyncMock, patch
 
 from tap_referral_saasquatch import STATE, do_sync
 from tap_referral_saasquatch.discover import discover
@@ -17,12 +17,12 @@ class AllFieldsIntegrationTest(ReferralBaseTest, unittest.TestCase):
     @patch("tap_referral_saasquatch.singer.write_state")
     @patch("tap_referral_saasquatch.write_record")
     @patch("tap_referral_saasquatch.singer.write_schema")
-    @patch("tap_referral_saasquatch.stream_export")
-    @patch("tap_referral_saasquatch.request_export")
+    @patch("tap_referral_saasquatch.export_rows")
+    @patch("tap_referral_saasquatch.ENGINE.ensure_export", new_callable=AsyncMock)
     def test_sync_all_streams_with_mocked_exports(
         self,
-        mock_request_export,
-        mock_stream_export,
+        mock_ensure_export,
+        mock_export_rows,
         _mock_write_schema,
         mock_write_record,
         _mock_write_state,
@@ -31,19 +31,23 @@ class AllFieldsIntegrationTest(ReferralBaseTest, unittest.TestCase):
         catalog.metadata = []
         catalog.get_selected_streams = lambda _state: catalog.streams
 
-        mock_request_export.side_effect = lambda stream: f"exp-{stream}"
+        mock_ensure_export.side_effect = lambda stream, since, until, cancelled=None: (
+            "2025-03-01T00:00:00Z", f"exp-{stream}")
 
         schemas, _ = get_schemas()
         data_by_stream = {
             stream_name: [self._generate_value(schema, date_value="2025-02-01T00:00:00Z")]
             for stream_name, schema in schemas.items()
         }
-        mock_stream_export.side_effect = lambda stream, _export_id: data_by_stream[stream]
+        mock_export_rows.side_effect = lambda stream, _export_id, fields=None: (
+            list(data_by_stream[stream][0]),
+            iter([tuple(record.values()) for record in data_by_stream[stream]]),
+        )
 
         do_sync(catalog)
 
-        self.assertEqual(mock_request_export.call_count, 3)
-        self.assertEqual(mock_stream_export.call_count, 3)
+        self.assertEqual(mock_ensure_export.call_count, 3)
+        self.assertEqual(mock_export_rows.call_count, 3)
         self.assertEqual(mock_write_record.call_count, 3)
 
         written_streams = {call_args.args[0] for call_args in mock_write_record.call_args_list}
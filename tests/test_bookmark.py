@@ -1,6 +1,5 @@
-import json
 import unittest
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 
 from tap_referral_saasquatch import STATE, do_sync, request_export
 from tap_referral_saasquatch.discover import discover
@@ -13,34 +12,35 @@ except ImportError:
 
 class BookmarkIntegrationTest(ReferralBaseTest, unittest.TestCase):
 
-    @patch("tap_referral_saasquatch.export_ready", return_value=True)
-    @patch("tap_referral_saasquatch.session.send")
-    def test_request_export_uses_existing_bookmark(self, mock_send, _mock_export_ready):
+    @patch("tap_referral_saasquatch.ENGINE.export_status", new_callable=AsyncMock,
+           return_value=(True, None))
+    @patch("tap_referral_saasquatch.CLIENT.session.request")
+    def test_request_export_uses_existing_bookmark(self, mock_request, _mock_export_status):
         STATE["users"] = "2025-06-01T00:00:00Z"
 
         response = MagicMock()
         response.status_code = 200
         response.json.return_value = {"id": "exp-users"}
-        mock_send.return_value = response
+        mock_request.return_value = response
 
         export_id = request_export("users")
         self.assertEqual(export_id, "exp-users")
 
-        prepared_request = mock_send.call_args[0][0]
-        body = prepared_request.body.decode("utf-8") if isinstance(prepared_request.body, bytes) else prepared_request.body
-        payload = json.loads(body)
+        method, url = mock_request.call_args[0]
+        self.assertEqual((method, url.rsplit("/", 1)[1]), ("POST", "export"))
+        payload = mock_request.call_args[1]["json"]
 
         self.assertEqual(payload["params"]["createdOrUpdatedSince"], "2025-06-01T00:00:00Z")
 
     @patch("tap_referral_saasquatch.singer.write_state")
     @patch("tap_referral_saasquatch.write_record")
     @patch("tap_referral_saasquatch.singer.write_schema")
-    @patch("tap_referral_saasquatch.stream_export")
-    @patch("tap_referral_saasquatch.request_export")
+    @patch("tap_referral_saasquatch.export_rows")
+    @patch("tap_referral_saasquatch.ENGINE.ensure_export", new_callable=AsyncMock)
     def test_sync_advances_bookmark_state(
         self,
-        mock_request_export,
-        mock_stream_export,
+        mock_ensure_export,
+        mock_export_rows,
         _mock_write_schema,
         _mock_write_record,
         _mock_write_state,
@@ -54,16 +54,17 @@ class BookmarkIntegrationTest(ReferralBaseTest, unittest.TestCase):
             stream for stream in catalog.streams if stream.tap_stream_id == "users"
         ]
 
-        mock_request_export.return_value = "exp-users"
-        mock_stream_export.return_value = [
+        mock_ensure_export.return_value = ("2025-03-02T00:00:00Z", "exp-users")
+        records = [
             self._generate_stream_record("users", date_value="2025-01-05T00:00:00Z"),
             self._generate_stream_record("users", date_value="2025-02-15T00:00:00Z"),
             self._generate_stream_record("users", date_value="2025-03-01T00:00:00Z"),
         ]
+        mock_export_rows.return_value = (list(records[0]), iter([tuple(r.values()) for r in records]))
 
         do_sync(catalog)
 
-        mock_request_export.assert_called_once_with("users")
+        mock_ensure_export.assert_called_once_with("users", old_bookmark, None, cancelled=None)
         self.assertEqual(_mock_write_record.call_count, 3)
         self.assertIn("users", STATE)
         self.assertGreaterEqual(STATE["users"], old_bookmark)
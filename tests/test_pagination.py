@@ -74,8 +74,17 @@ class PaginationIntegrationTest(ReferralBaseTest, unittest.TestCase):
             )
         return rows
 
-    @patch("tap_referral_saasquatch.requests.get")
-    def test_stream_export_reads_all_rows_across_chunk_patterns(self, mock_get):
+    @staticmethod
+    def _download_response(chunks):
+        response = MagicMock()
+        response.status_code = 200
+        response.headers = {}
+        response.iter_content.return_value = chunks
+        response.__enter__.return_value = response
+        return response
+
+    @patch("tap_referral_saasquatch.CLIENT.session.request")
+    def test_stream_export_reads_all_rows_across_chunk_patterns(self, mock_request):
         expected_rows = self._build_dynamic_user_rows()
         field_names = ["id", "accountId", "firstName", "dateCreated"]
         payload = self._to_csv_payload(expected_rows, field_names)
@@ -93,16 +102,14 @@ class PaginationIntegrationTest(ReferralBaseTest, unittest.TestCase):
                 if pattern_name == "contains_empty_chunk" and len(chunks) > 1:
                     chunks.insert(1, b"")
 
-                response = MagicMock()
-                response.iter_content.return_value = chunks
-                mock_get.return_value = response
+                mock_request.return_value = self._download_response(chunks)
 
-                rows = stream_export("users", "exp-1")
+                rows = list(stream_export("users", "exp-1"))
 
                 self.assertEqual(rows, expected_rows)
 
-    @patch("tap_referral_saasquatch.requests.get")
-    def test_stream_export_referrals_across_chunk_patterns(self, mock_get):
+    @patch("tap_referral_saasquatch.CLIENT.session.request")
+    def test_stream_export_referrals_across_chunk_patterns(self, mock_request):
         expected_rows = self._build_dynamic_referral_rows()
         field_names = [
             "id",
@@ -121,10 +128,8 @@ class PaginationIntegrationTest(ReferralBaseTest, unittest.TestCase):
 
         for pattern_name, sizes in chunk_patterns.items():
             with self.subTest(pattern=pattern_name):
-                response = MagicMock()
-                response.iter_content.return_value = self._chunk_payload(payload, sizes)
-                mock_get.return_value = response
+                mock_request.return_value = self._download_response(self._chunk_payload(payload, sizes))
 
-                rows = stream_export("referrals", "exp-2")
+                rows = list(stream_export("referrals", "exp-2"))
 
                 self.assertEqual(rows, expected_rows)
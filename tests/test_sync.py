@@ -1,6 +1,6 @@
 import datetime
 import pytest
-from unittest.mock import patch, MagicMock
+from unittest.mock import AsyncMock, patch, MagicMock
 
 from tap_referral_saasquatch import do_sync, CONFIG, STATE
 from singer.utils import strftime, update_state as real_update_state
@@ -12,7 +12,9 @@ STATE.clear()
 def mock_catalog():
     mock_stream_obj = MagicMock()
     mock_stream_obj.schema.to_dict.return_value = {
-        "type": "object", "properties": {"id": {"type": "string"}}
+        "type": "object", "properties": {"id": {"type": "string"},
+                                         "name": {"type": "string"},
+                                         "dateCreated": {"type": "string"}}
     }
 
     mock = MagicMock()
@@ -24,32 +26,32 @@ def mock_catalog():
 
 @patch("tap_referral_saasquatch.singer.write_state")
 @patch("tap_referral_saasquatch.utils.update_state", side_effect=real_update_state)
-@patch("tap_referral_saasquatch.request_export")
-@patch("tap_referral_saasquatch.stream_export")
+@patch("tap_referral_saasquatch.ENGINE.ensure_export", new_callable=AsyncMock)
+@patch("tap_referral_saasquatch.export_rows")
 @patch("tap_referral_saasquatch.write_record")
 @patch("tap_referral_saasquatch.metadata.to_map")
 @patch("tap_referral_saasquatch.singer.Transformer")
 def test_do_sync(mock_transformer_cls, mock_metadata_map, mock_write_record,
-                 mock_stream_export, mock_request_export, mock_update_state,
+                 mock_export_rows, mock_ensure_export, mock_update_state,
                  mock_write_state, mock_catalog):
 
+    export_start_time = strftime(datetime.datetime.now(datetime.UTC))
     # Mock export id and rows with a replication key value
-    mock_request_export.return_value = "fake_export_id"
-    mock_stream_export.return_value = [
-        {"id": "1", "name": "Alice", "dateCreated": "2025-07-01T00:00:00Z"},
-        {"id": "2", "name": "Bob", "dateCreated": "2025-07-02T00:00:00Z"},       # newest
-        {"id": "3", "name": "Charlie", "dateCreated": "2025-06-30T00:00:00Z"},  # older
-    ]
+    mock_ensure_export.return_value = (export_start_time, "fake_export_id")
+    mock_export_rows.return_value = (["id", "name", "dateCreated"], iter([
+        ("1", "Alice", "2025-07-01T00:00:00Z"),
+        ("2", "Bob", "2025-07-02T00:00:00Z"),       # newest
+        ("3", "Charlie", "2025-06-30T00:00:00Z"),  # older
+    ]))
     mock_metadata_map.return_value = {}
 
     mock_transformer = MagicMock()
     mock_transformer.transform.side_effect = lambda r, s, m: r
     mock_transformer_cls.return_value.__enter__.return_value = mock_transformer
-    export_start_time = strftime(datetime.datetime.now(datetime.UTC))
     do_sync(mock_catalog)
 
-    mock_request_export.assert_called_once_with("users")
-    mock_stream_export.assert_called_once_with("users", "fake_export_id")
+    mock_ensure_export.assert_called_once_with("users", "2025-01-01T00:00:00Z", None, cancelled=None)
+    mock_export_rows.assert_called_once_with("users", "fake_export_id", fields=["id", "name", "dateCreated"])
     assert mock_write_record.call_count == 3
 
     mock_write_record.assert_any_call("users", {"id": "1", "name": "Alice", "dateCreated": "2025-07-01T00:00:00Z"})
@@ -63,4 +65,5 @@ def test_do_sync(mock_transformer_cls, mock_metadata_map, mock_write_record,
     assert args[1] == "users"
     assert STATE['users'] >= export_start_time  # updated entity state date
 
-    mock_write_state.assert_called_once()
+    # once to record the export being downloaded, once to advance the bookmark
+    assert mock_write_state.call_count == 2
@@ -0,0 +1,43 @@
+import unittest
+from unittest.mock import MagicMock
+
+from tap_referral_saasquatch import CONFIG, STATE
+
+ID_PROPERTIES = {"id": {"type": ["null", "string"]}}
+
+
+def mock_catalog(properties=None):
+    """Return a mock catalog whose every stream has a flat schema of properties and no metadata"""
+
+    catalog = MagicMock()
+    catalog.metadata = []
+    catalog.get_stream.return_value.metadata = []
+    catalog.get_stream.return_value.schema.to_dict.return_value = {
+        "type": "object",
+        "properties": properties or ID_PROPERTIES,
+    }
+    return catalog
+
+
+class SyncTestCase(unittest.TestCase):
+    """
+    Runs each test against an empty STATE and a mock catalog in
+    self.catalog, with the schema properties of the class. STATE and CONFIG
+    are restored afterwards
+    """
+
+    properties = ID_PROPERTIES
+
+    def setUp(self):
+        original_state = dict(STATE)
+        original_config = dict(CONFIG)
+        self.addCleanup(self.restore, original_state, original_config)
+        STATE.clear()
+        self.catalog = mock_catalog(self.properties)
+
+    @staticmethod
+    def restore(state, config):
+        STATE.clear()
+        STATE.update(state)
+        CONFIG.clear()
+        CONFIG.update(config)
@@ -0,0 +1,165 @@
+import gzip
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+import requests
+
+from tap_referral_saasquatch import CONFIG, export_chunks, export_entity, request_export
+from tap_referral_saasquatch.cache import DownloadCache, ExportCache
+
+from sync_base import SyncTestCase
+
+
+class TestExportCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.config = {"tenant_alias": "tenant-a",
+                       "export_cache_path": os.path.join(self.tmp.name, "exports.json")}
+        self.cache = ExportCache(self.config)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_put_get_remove(self):
+        self.cache.put("users", "2025-01-01T00:00:00Z", None, "exp-1", "2025-02-01T00:00:00Z")
+
+        self.assertEqual(self.cache.get("users", "2025-01-01T00:00:00Z", None)["id"], "exp-1")
+        self.assertIsNone(self.cache.get("users", "2025-01-02T00:00:00Z", None))
+        self.assertIsNone(self.cache.get("referrals", "2025-01-01T00:00:00Z", None))
+
+        self.cache.remove("users", "2025-01-01T00:00:00Z", None)
+        self.assertIsNone(self.cache.get("users", "2025-01-01T00:00:00Z", None))
+
+    def test_entries_are_keyed_by_tenant(self):
+        self.cache.put("users", "2025-01-01T00:00:00Z", None, "exp-1", "2025-02-01T00:00:00Z")
+        other_tenant = ExportCache(dict(self.config, tenant_alias="tenant-b"))
+
+        self.assertIsNone(other_tenant.get("users", "2025-01-01T00:00:00Z", None))
+
+    def test_expired_entries_are_ignored(self):
+        self.cache.put("users", "2025-01-01T00:00:00Z", None, "exp-1", "2025-02-01T00:00:00Z")
+        self.config["export_cache_ttl"] = "60"
+
+        with patch("tap_referral_saasquatch.cache.time.time", return_value=10 ** 12):
+            self.assertIsNone(self.cache.get("users", "2025-01-01T00:00:00Z", None))
+
+    def test_caches_sharing_a_path_do_not_lose_entries(self):
+        caches = [ExportCache(dict(self.config, tenant_alias=alias)) for alias in ("tenant-a", "tenant-b")]
+
+        def put_many(cache):
+            for i in range(50):
+                cache.put("users", "since-{}".format(i), None, "exp-{}".format(i), "start")
+
+        threads = [threading.Thread(target=put_many, args=(cache,)) for cache in caches]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for cache in caches:
+            self.assertEqual(cache.get("users", "since-49", None)["id"], "exp-49")
+        self.assertEqual(len(self.cache.load()), 100)
+        self.assertEqual(os.listdir(self.tmp.name), ["exports.json"])
+
+    def test_disabled_without_path(self):
+        cache = ExportCache({"tenant_alias": "tenant-a"})
+        cache.put("users", "since", None, "exp-1", "start")
+
+        self.assertIsNone(cache.get("users", "since", None))
+
+
+class TestDownloadCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.config = {"tenant_alias": "tenant-a", "download_cache_dir": self.tmp.name}
+        self.cache = DownloadCache(self.config)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_write_through_stores_compressed_download(self):
+        chunks = list(self.cache.write_through("exp-1", iter([b"id\n", b"1\n"])))
+
+        self.assertEqual(chunks, [b"id\n", b"1\n"])
+        with gzip.open(os.path.join(self.tmp.name, "tenant-a-exp-1.csv.gz")) as cached:
+            self.assertEqual(cached.read(), b"id\n1\n")
+        self.assertEqual(b"".join(self.cache.read("exp-1")), b"id\n1\n")
+        self.assertEqual(b"".join(self.cache.read("exp-1", offset=3)), b"1\n")
+        self.assertIsNone(self.cache.read("exp-2"))
+
+    def test_incomplete_download_is_not_cached(self):
+        chunks = self.cache.write_through("exp-1", iter([b"id\n", b"1\n"]))
+        next(chunks)
+        chunks.close()
+
+        self.assertIsNone(self.cache.read("exp-1"))
+        self.assertEqual(os.listdir(self.tmp.name), [])
+
+    def test_evicts_least_recently_used(self):
+        self.config["download_cache_max_bytes"] = "1"
+        list(self.cache.write_through("exp-1", iter([b"a"])))
+        os.utime(self.cache.path("exp-1"), (0, 0))
+        list(self.cache.write_through("exp-2", iter([b"b"])))
+
+        self.assertIsNone(self.cache.read("exp-1"))
+        self.assertEqual(b"".join(self.cache.read("exp-2")), b"b")
+
+    def test_disabled_without_directory(self):
+        cache = DownloadCache({"tenant_alias": "tenant-a"})
+        chunks = iter([b"id\n"])
+
+        self.assertIs(cache.write_through("exp-1", chunks), chunks)
+        self.assertIsNone(cache.read("exp-1"))
+
+    @patch("tap_referral_saasquatch.engine.ResumableDownload")
+    def test_export_chunks_reads_cached_export(self, mock_download_cls):
+        mock_download_cls.return_value.iter_content.return_value = iter([b"id\n1\n"])
+        with patch.dict(CONFIG, self.config):
+            self.assertEqual(b"".join(export_chunks("exp-1")), b"id\n1\n")
+            self.assertEqual(b"".join(export_chunks("exp-1")), b"id\n1\n")
+
+        mock_download_cls.assert_called_once()
+
+
+class TestExportReuse(SyncTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmp = tempfile.TemporaryDirectory()
+        CONFIG.update({"api_key": "dummy-key", "tenant_alias": "tenant-a",
+                       "start_date": "2025-01-01T00:00:00Z",
+                       "export_cache_path": os.path.join(self.tmp.name, "exports.json")})
+        self.cache = ExportCache(CONFIG)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    @patch("tap_referral_saasquatch.wait_for_export")
+    @patch("tap_referral_saasquatch.CLIENT.post")
+    def test_request_export_records_export_before_waiting(self, mock_post, mock_wait):
+        mock_post.return_value.json.return_value = {"id": "exp-9"}
+        mock_wait.side_effect = lambda *args, **kwargs: self.assertEqual(
+            self.cache.get("users", "2025-01-01T00:00:00Z", None)["id"], "exp-9")
+
+        self.assertEqual(request_export("users"), "exp-9")
+        mock_wait.assert_called_once()
+
+    @patch("tap_referral_saasquatch.ENGINE.request_export")
+    @patch("tap_referral_saasquatch.ENGINE.wait_for_export")
+    def test_export_entity_reuses_cached_export(self, mock_wait, mock_request_export):
+        self.cache.put("users", "2025-01-01T00:00:00Z", None, "exp-1", "2025-02-01T00:00:00Z")
+
+        self.assertEqual(export_entity("users"), ("2025-02-01T00:00:00Z", "exp-1"))
+        mock_wait.assert_called_once_with("users", "exp-1", cancelled=None)
+        mock_request_export.assert_not_called()
+
+    @patch("tap_referral_saasquatch.ENGINE.request_export", return_value="exp-2")
+    @patch("tap_referral_saasquatch.ENGINE.wait_for_export")
+    def test_export_entity_drops_unavailable_cached_export(self, mock_wait, mock_request_export):
+        self.cache.put("users", "2025-01-01T00:00:00Z", None, "exp-1", "2025-02-01T00:00:00Z")
+        mock_wait.side_effect = requests.exceptions.HTTPError(response=MagicMock(status_code=404))
+
+        self.assertEqual(export_entity("users")[1], "exp-2")
+        self.assertIsNone(self.cache.get("users", "2025-01-01T00:00:00Z", None))
@@ -0,0 +1,130 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+from tap_referral_saasquatch import CHANGE_INDEXES, CONFIG, STATE, finish_change_index, sync_export
+from tap_referral_saasquatch.changes import ChangeIndex
+
+from sync_base import SyncTestCase
+
+
+class TestChangeIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.generation = None
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def index(self):
+        return ChangeIndex(self.tmp.name, "tenant-a-reward_balances", ["userId", "accountId"],
+                           generation=self.generation)
+
+    def sync(self, records, partial=False):
+        index = self.index()
+        if partial:
+            index.mark_partial()
+        changed = [r["userId"] for r in records if index.changed(r)]
+        deleted = [r["userId"] for r in index.deleted()]
+        self.generation = index.save()
+        return changed, deleted
+
+    def test_emits_new_and_changed_rows(self):
+        first = [{"userId": "u1", "accountId": "a", "amount": 1},
+                 {"userId": "u2", "accountId": "a", "amount": 2}]
+        self.assertEqual(self.sync(first), (["u1", "u2"], []))
+
+        second = [{"userId": "u1", "accountId": "a", "amount": 1},
+                  {"userId": "u2", "accountId": "a", "amount": 5},
+                  {"userId": "u3", "accountId": "a", "amount": 3}]
+        self.assertEqual(self.sync(second), (["u2", "u3"], []))
+        self.assertEqual(self.sync(second), ([], []))
+
+    def test_reports_deleted_rows(self):
+        self.sync([{"userId": "u1", "accountId": "a"}, {"userId": "u2", "accountId": "a"}])
+
+        self.assertEqual(self.sync([{"userId": "u2", "accountId": "a"}]), ([], ["u1"]))
+        self.assertEqual(self.sync([{"userId": "u2", "accountId": "a"}]), ([], []))
+
+    def test_rows_sharing_a_key(self):
+        first = [{"userId": "u1", "accountId": "a", "type": "CREDIT", "amount": 1},
+                 {"userId": "u1", "accountId": "a", "type": "PCT_DISCOUNT", "amount": 10}]
+        self.assertEqual(self.sync(first), (["u1", "u1"], []))
+        self.assertEqual(self.sync(first), ([], []))
+
+        changed = [{"userId": "u1", "accountId": "a", "type": "CREDIT", "amount": 2},
+                   {"userId": "u1", "accountId": "a", "type": "PCT_DISCOUNT", "amount": 10}]
+        index = self.index()
+        self.assertEqual([index.changed(r) for r in changed], [True, False])
+        self.generation = index.save()
+
+        # A key keeps its remaining rows, so it is only deleted once all are gone
+        self.assertEqual(self.sync(changed[1:]), ([], []))
+        self.assertEqual(self.sync([{"userId": "u2", "accountId": "a"}]), (["u2"], ["u1"]))
+
+    def test_uncommitted_generation_is_not_compared_against(self):
+        rows = [{"userId": "u1", "accountId": "a", "amount": 1}]
+        self.assertEqual(self.sync(rows), (["u1"], []))
+        committed = self.generation
+
+        # The target fails before committing the state naming the next
+        # generation, so the following sync compares against the same one
+        self.assertEqual(self.sync(rows + [{"userId": "u2", "accountId": "a"}]), (["u2"], []))
+        self.generation = committed
+        self.assertEqual(self.sync(rows + [{"userId": "u2", "accountId": "a"}]), (["u2"], []))
+
+        self.assertEqual(self.sync(rows), ([], ["u2"]))
+        self.assertEqual(sorted(os.listdir(self.tmp.name)),
+                         ["tenant-a-reward_balances.2.idx.gz", "tenant-a-reward_balances.3.idx.gz"])
+
+    def test_none_key_is_not_the_string_none(self):
+        self.sync([{"userId": "u1", "accountId": None}])
+
+        self.assertEqual(self.sync([{"userId": "u1", "accountId": "None"}]), (["u1"], ["u1"]))
+
+    def test_partial_sync_keeps_unseen_rows(self):
+        self.sync([{"userId": "u1", "accountId": "a"}, {"userId": "u2", "accountId": "a"}])
+
+        self.assertEqual(self.sync([{"userId": "u2", "accountId": "a"}], partial=True), ([], []))
+        self.assertEqual(self.sync([{"userId": "u1", "accountId": "a"}]), ([], ["u2"]))
+
+
+class TestChangeDetectionSync(SyncTestCase):
+    properties = {"userId": {"type": ["null", "string"]},
+                  "accountId": {"type": ["null", "string"]},
+                  "amount": {"type": ["null", "string"]}}
+
+    def setUp(self):
+        super().setUp()
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        CHANGE_INDEXES.clear()
+        self.tmp.cleanup()
+
+    @patch("tap_referral_saasquatch.singer.write_state")
+    @patch("tap_referral_saasquatch.write_record")
+    @patch("tap_referral_saasquatch.export_rows")
+    def test_only_changed_and_deleted_rows_are_emitted(self, mock_export_rows, mock_write_record,
+                                                        mock_write_state):
+        mock_export_rows.side_effect = [
+            (["userId", "accountId", "amount"], iter([("u1", "a", "1"), ("u2", "a", "2")])),
+            (["userId", "accountId", "amount"], iter([("u2", "a", "3")])),
+        ]
+
+        with patch.dict(CONFIG, {"emit_deletions": "true"}):
+            for export_id in ["export-1", "export-2"]:
+                mock_write_record.reset_mock()
+                CHANGE_INDEXES["reward_balances"] = ChangeIndex(
+                    self.tmp.name, "tenant-a-reward_balances", ["userId", "accountId"],
+                    generation=STATE.get("change_indexes", {}).get("reward_balances"))
+                sync_export("reward_balances", export_id, "2025-02-01T00:00:00Z", self.catalog, MagicMock())
+                finish_change_index("reward_balances")
+
+        written = [c[0][1] for c in mock_write_record.call_args_list]
+        self.assertEqual(written[0], {"userId": "u2", "accountId": "a", "amount": "3"})
+        self.assertEqual(written[1]["userId"], "u1")
+        self.assertIn("_sdc_deleted_at", written[1])
+        self.assertEqual(len(written), 2)
+        self.assertEqual(STATE["change_indexes"], {"reward_balances": 2})
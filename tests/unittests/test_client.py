@@ -1,7 +1,30 @@
+import gzip
+import io
+import json
 import unittest
-from unittest.mock import MagicMock, patch
+import zlib
+from unittest.mock import AsyncMock, MagicMock, patch
 
-from tap_referral_saasquatch import CONFIG, export_ready, request_export
+import requests
+import urllib3
+
+from tap_referral_saasquatch import (
+    CONFIG,
+    export_ready,
+    request_export,
+    wait_for_export,
+)
+from tap_referral_saasquatch.client import ResumableDownload, SaaSquatchClient
+from tap_referral_saasquatch.engine import parse_retry_after, poll_intervals
+
+
+def make_response(status_code, json_body=None, content=b""):
+    response = requests.Response()
+    response.status_code = status_code
+    response.url = "https://app.referralsaasquatch.com/api/v1/tenant-a/export"
+    response._content = json.dumps(json_body).encode() if json_body is not None else content
+    response._content_consumed = True
+    return response
 
 
 class TestClient(unittest.TestCase):
@@ -19,46 +42,249 @@ class TestClient(unittest.TestCase):
         CONFIG.clear()
         CONFIG.update(self.original_config)
 
-    @patch("tap_referral_saasquatch.requests.get")
-    def test_export_ready_completed(self, mock_get):
-        response = MagicMock()
-        response.json.return_value = {"status": "COMPLETED"}
-        mock_get.return_value = response
+    @patch("tap_referral_saasquatch.CLIENT.session.request")
+    def test_export_ready_completed(self, mock_request):
+        mock_request.return_value = make_response(200, {"status": "COMPLETED"})
 
         self.assertTrue(export_ready("exp-1"))
+        self.assertEqual(mock_request.call_args[0],
+                         ("GET", "https://app.referralsaasquatch.com/api/v1/tenant-a/export/exp-1"))
 
-    @patch("tap_referral_saasquatch.requests.get")
-    def test_export_ready_not_completed(self, mock_get):
-        response = MagicMock()
-        response.json.return_value = {"status": "PROCESSING"}
-        mock_get.return_value = response
+    @patch("tap_referral_saasquatch.CLIENT.session.request")
+    def test_export_ready_not_completed(self, mock_request):
+        mock_request.return_value = make_response(200, {"status": "PROCESSING"})
 
         self.assertFalse(export_ready("exp-2"))
 
+    @patch("backoff._sync.time.sleep")
     @patch("tap_referral_saasquatch.sys.exit", side_effect=SystemExit(1))
-    @patch("tap_referral_saasquatch.session.send")
-    def test_request_export_http_error_exits(self, mock_send, mock_exit):
-        response = MagicMock()
-        response.status_code = 500
-        response.content = b"failure"
-        mock_send.return_value = response
+    @patch("tap_referral_saasquatch.CLIENT.session.request")
+    def test_request_export_http_error_exits(self, mock_request, mock_exit, mock_backoff_sleep):
+        mock_request.return_value = make_response(500, content=b"failure")
 
         with self.assertRaises(SystemExit):
             request_export("users")
 
         mock_exit.assert_called_once_with(1)
+        # The server may have created the export, so the POST is not retried
+        self.assertEqual(mock_request.call_count, 1)
 
-    @patch("tap_referral_saasquatch.time.sleep")
-    @patch("tap_referral_saasquatch.export_ready", side_effect=[False, True])
-    @patch("tap_referral_saasquatch.session.send")
-    def test_request_export_waits_until_ready(self, mock_send, mock_export_ready, mock_sleep):
-        response = MagicMock()
-        response.status_code = 200
-        response.json.return_value = {"id": "exp-42"}
-        mock_send.return_value = response
+    @patch("tap_referral_saasquatch.engine.asyncio.sleep", new_callable=AsyncMock)
+    @patch("tap_referral_saasquatch.ENGINE.export_status", side_effect=[(False, None), (True, None)])
+    @patch("tap_referral_saasquatch.CLIENT.session.request")
+    def test_request_export_waits_until_ready(self, mock_request, mock_export_status, mock_sleep):
+        mock_request.return_value = make_response(200, {"id": "exp-42"})
 
         export_id = request_export("users")
 
         self.assertEqual(export_id, "exp-42")
-        self.assertEqual(mock_export_ready.call_count, 2)
-        mock_sleep.assert_called_once_with(5)
+        self.assertEqual(mock_export_status.call_count, 2)
+        mock_sleep.assert_called_once()
+        self.assertTrue(0.5 <= mock_sleep.call_args[0][0] <= 1)
+
+    @patch("tap_referral_saasquatch.engine.asyncio.sleep", new_callable=AsyncMock)
+    @patch("tap_referral_saasquatch.ENGINE.export_status",
+           side_effect=[(False, None), (False, 30.0), (True, None)])
+    def test_wait_for_export_honors_retry_after(self, mock_export_status, mock_sleep):
+        wait_for_export("users", "exp-1")
+
+        delays = [c[0][0] for c in mock_sleep.call_args_list]
+        self.assertEqual(len(delays), 2)
+        self.assertEqual(delays[1], 30.0)
+
+    @patch("tap_referral_saasquatch.engine.asyncio.sleep", new_callable=AsyncMock)
+    @patch("tap_referral_saasquatch.ENGINE.export_status", return_value=(False, None))
+    def test_wait_for_export_times_out(self, mock_export_status, mock_sleep):
+        CONFIG["export_timeout"] = 0
+
+        with self.assertRaises(Exception) as ctx:
+            wait_for_export("users", "exp-1")
+
+        self.assertIn("users export took over 0 seconds", str(ctx.exception))
+        mock_sleep.assert_not_called()
+
+    def test_poll_intervals_back_off_to_ceiling(self):
+        intervals = poll_intervals(8)
+        delays = [next(intervals) for _ in range(6)]
+
+        for delay, ceiling in zip(delays, [1, 2, 4, 8, 8, 8]):
+            self.assertTrue(ceiling / 2 <= delay <= ceiling)
+
+    def test_parse_retry_after(self):
+        self.assertEqual(parse_retry_after("12"), 12.0)
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after("not a date"))
+        self.assertEqual(parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT"), 0)
+
+
+class TestSaaSquatchClient(unittest.TestCase):
+    def setUp(self):
+        self.config = {"api_key": "dummy-key", "tenant_alias": "tenant-a", "user_agent": "tap-test"}
+        self.client = SaaSquatchClient(self.config)
+
+    @patch.object(requests.Session, "request")
+    def test_requests_share_session_auth_headers_and_timeout(self, mock_request):
+        mock_request.return_value = make_response(200, {})
+        self.config["request_timeout"] = "60"
+
+        self.client.get("/export/exp-1")
+        self.client.get("/export/exp-1/download", stream=True)
+
+        self.assertEqual(mock_request.call_count, 2)
+        for call in mock_request.call_args_list:
+            self.assertEqual(call[1]["auth"], ("", "dummy-key"))
+            self.assertEqual(call[1]["headers"], {"User-Agent": "tap-test"})
+            self.assertEqual(call[1]["timeout"], (10.0, 60.0))
+        self.assertTrue(mock_request.call_args_list[1][1]["stream"])
+        self.assertEqual(self.client.session.headers["Content-Type"], "application/json")
+
+    def test_base_url_override(self):
+        self.assertEqual(self.client.base_url, "https://app.referralsaasquatch.com/api/v1/tenant-a")
+        self.config["base_url"] = "http://127.0.0.1:8080/api/v1/{}"
+
+        self.assertEqual(self.client.base_url, "http://127.0.0.1:8080/api/v1/tenant-a")
+
+    @patch("backoff._sync.time.sleep")
+    @patch.object(requests.Session, "request")
+    def test_retries_transient_failures(self, mock_request, mock_sleep):
+        mock_request.side_effect = [
+            requests.exceptions.ConnectionError("reset"),
+            make_response(429),
+            make_response(503),
+            make_response(200, {"status": "COMPLETED"}),
+        ]
+
+        resp = self.client.get("/export/exp-1")
+
+        self.assertEqual(resp.json(), {"status": "COMPLETED"})
+        self.assertEqual(mock_request.call_count, 4)
+
+    @patch("backoff._sync.time.sleep")
+    @patch.object(requests.Session, "request")
+    def test_retries_post_only_when_not_received(self, mock_request, mock_sleep):
+        refused = requests.exceptions.ConnectionError(urllib3.exceptions.MaxRetryError(
+            None, "/export", urllib3.exceptions.NewConnectionError(None, "refused")))
+        mock_request.side_effect = [
+            refused,
+            requests.exceptions.ConnectTimeout("connect timed out"),
+            make_response(429),
+            make_response(200, {"id": "exp-1"}),
+        ]
+
+        self.assertEqual(self.client.post("/export", json={}).json(), {"id": "exp-1"})
+        self.assertEqual(mock_request.call_count, 4)
+
+        for error in [make_response(503),
+                      requests.exceptions.ReadTimeout("read timed out"),
+                      requests.exceptions.ConnectionError("connection reset")]:
+            mock_request.reset_mock()
+            mock_request.side_effect = [error, make_response(200, {"id": "exp-2"})]
+
+            with self.assertRaises(requests.exceptions.RequestException):
+                self.client.post("/export", json={})
+
+            self.assertEqual(mock_request.call_count, 1)
+
+    @patch("backoff._sync.time.sleep")
+    @patch.object(requests.Session, "request")
+    def test_does_not_retry_client_errors(self, mock_request, mock_sleep):
+        mock_request.return_value = make_response(404)
+
+        with self.assertRaises(requests.exceptions.HTTPError):
+            self.client.get("/export/missing")
+
+        self.assertEqual(mock_request.call_count, 1)
+
+
+class TestResumableDownload(unittest.TestCase):
+    def make_stream(self, status_code, chunks, error=None):
+        response = MagicMock()
+        response.status_code = status_code
+        response.raw.tell.return_value = 0
+
+        def iter_content(chunk_size):
+            for chunk in chunks:
+                response.raw.tell.return_value += len(chunk)
+                yield chunk
+            if error is not None:
+                raise error
+
+        response.iter_content.side_effect = iter_content
+        response.__enter__.return_value = response
+        return response
+
+    def make_encoded_response(self, payload, encoding):
+        response = requests.Response()
+        response.status_code = 200
+        response.headers["Content-Encoding"] = encoding
+        response.raw = urllib3.HTTPResponse(body=io.BytesIO(payload),
+                                            headers={"Content-Encoding": encoding},
+                                            preload_content=False)
+        return response
+
+    def test_decodes_encoded_download(self):
+        body = b"id,name\n" + b"".join(b"%d,user\n" % i for i in range(1000))
+        half = len(body) // 2
+        raw_deflate = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+        for encoding, payload in [("gzip", gzip.compress(body)),
+                                  # Each gzip member is decoded, not just the first
+                                  ("gzip", gzip.compress(body[:half]) + gzip.compress(body[half:])),
+                                  ("deflate", zlib.compress(body)),
+                                  ("deflate", raw_deflate.compress(body) + raw_deflate.flush())]:
+            client = MagicMock()
+            client.get.return_value = self.make_encoded_response(payload, encoding)
+            download = ResumableDownload(client, "/export/exp-1/download")
+
+            self.assertEqual(b"".join(download.iter_content(chunk_size=100)), body)
+            self.assertEqual(download.bytes_transferred, len(payload))
+            self.assertEqual(download.bytes_read, len(body))
+
+    @patch("tap_referral_saasquatch.client.time.sleep")
+    def test_resumes_encoded_download_unencoded(self, mock_sleep):
+        client = MagicMock()
+        client.get.side_effect = [
+            self.make_stream(200, [b"id\n1\n"], requests.exceptions.ConnectionError("reset")),
+            self.make_stream(206, [b"2\n3\n"]),
+        ]
+        download = ResumableDownload(client, "/export/exp-1/download")
+
+        self.assertEqual(b"".join(download.iter_content(chunk_size=4)), b"id\n1\n2\n3\n")
+        self.assertEqual(client.get.call_args_list[1][1]["headers"],
+                         {"Range": "bytes=5-", "Accept-Encoding": "identity"})
+        self.assertEqual(download.bytes_transferred, 9)
+
+    @patch("tap_referral_saasquatch.client.time.sleep")
+    def test_resumes_with_range_request(self, mock_sleep):
+        client = MagicMock()
+        client.get.side_effect = [
+            self.make_stream(200, [b"id\n1", b"\n2"], requests.exceptions.ChunkedEncodingError("dropped")),
+            self.make_stream(206, [b"\n3\n"]),
+        ]
+        download = ResumableDownload(client, "/export/exp-1/download")
+
+        self.assertEqual(b"".join(download.iter_content(chunk_size=4)), b"id\n1\n2\n3\n")
+        self.assertEqual(client.get.call_args_list[1][1]["headers"]["Range"], "bytes=6-")
+        self.assertEqual(download.resumes, 1)
+
+    @patch("tap_referral_saasquatch.client.time.sleep")
+    def test_skips_bytes_already_read_when_range_ignored(self, mock_sleep):
+        client = MagicMock()
+        client.get.side_effect = [
+            self.make_stream(200, [b"id\n1", b"\n2"], requests.exceptions.ConnectionError("reset")),
+            self.make_stream(200, [b"id\n", b"1\n2\n3\n"]),
+        ]
+        download = ResumableDownload(client, "/export/exp-1/download")
+
+        self.assertEqual(b"".join(download.iter_content(chunk_size=4)), b"id\n1\n2\n3\n")
+
+    @patch("tap_referral_saasquatch.client.time.sleep")
+    def test_gives_up_after_max_resumes(self, mock_sleep):
+        client = MagicMock()
+        client.get.side_effect = lambda *args, **kwargs: self.make_stream(
+            206, [b"x"], requests.exceptions.ConnectionError("reset"))
+        download = ResumableDownload(client, "/export/exp-1/download", max_resumes=2)
+
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            b"".join(download.iter_content())
+
+        self.assertEqual(client.get.call_count, 3)
@@ -0,0 +1,65 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from tap_referral_saasquatch import CONFIG, KEY_FILTERS, do_sync, sync_export
+from tap_referral_saasquatch.dedup import KeyFilter
+
+from sync_base import SyncTestCase
+
+
+class TestKeyFilter(unittest.TestCase):
+    def test_add_reports_new_keys(self):
+        key_filter = KeyFilter(["id", "accountId"])
+
+        self.assertTrue(key_filter.add({"id": "u1", "accountId": "a1", "name": "Ann"}))
+        self.assertTrue(key_filter.add({"id": "u1", "accountId": "a2"}))
+        self.assertFalse(key_filter.add({"id": "u1", "accountId": "a1", "name": "Changed"}))
+        self.assertEqual(len(key_filter), 2)
+
+    def test_none_is_not_the_string_none(self):
+        key_filter = KeyFilter(["id", "accountId"])
+
+        self.assertTrue(key_filter.add({"id": "u1", "accountId": None}))
+        self.assertTrue(key_filter.add({"id": "u1", "accountId": "None"}))
+
+    def test_keys_survive_merge(self):
+        key_filter = KeyFilter(["id"])
+
+        with patch("tap_referral_saasquatch.dedup.PENDING_MIN_KEYS", 4):
+            for i in range(50):
+                self.assertTrue(key_filter.add({"id": i}))
+            for i in range(50):
+                self.assertFalse(key_filter.add({"id": i}))
+
+        self.assertEqual(len(key_filter), 50)
+        self.assertEqual(list(key_filter.keys), sorted(key_filter.keys))
+
+
+class TestDeduplicatedSync(SyncTestCase):
+    def tearDown(self):
+        KEY_FILTERS.clear()
+
+    @patch("tap_referral_saasquatch.singer.write_state")
+    @patch("tap_referral_saasquatch.write_record")
+    @patch("tap_referral_saasquatch.export_rows")
+    def test_overlapping_exports_emit_each_key_once(self, mock_export_rows, mock_write_record,
+                                                    mock_write_state):
+        KEY_FILTERS["referrals"] = KeyFilter(["id"])
+        mock_export_rows.side_effect = [(["id"], iter([("1",), ("2",)])),
+                                        (["id"], iter([("2",), ("3",)]))]
+
+        sync_export("referrals", "export-1", "2025-02-01T00:00:00Z", self.catalog, MagicMock())
+        sync_export("referrals", "export-2", "2025-03-01T00:00:00Z", self.catalog, MagicMock())
+
+        written = [c[0][1]["id"] for c in mock_write_record.call_args_list]
+        self.assertEqual(written, ["1", "2", "3"])
+
+    @patch("tap_referral_saasquatch.sync_entity")
+    def test_only_incremental_streams_are_deduplicated(self, mock_sync_entity):
+        self.catalog.get_selected_streams.return_value = [
+            MagicMock(stream=stream) for stream in ("users", "reward_balances", "referrals")]
+
+        with patch.dict(CONFIG, {"dedup_records": "true"}):
+            do_sync(self.catalog)
+
+        self.assertEqual(sorted(KEY_FILTERS), ["referrals", "users"])
@@ -0,0 +1,208 @@
+import asyncio
+import threading
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+
+import requests
+
+from tap_referral_saasquatch.engine import EventLoopThread, ExportEngine, bounded, iter_async
+
+
+class FakeTransport:
+    """Export API held in memory, completing each export after pending_polls polls"""
+
+    def __init__(self, pending_polls=0, body=b""):
+        self.pending_polls = pending_polls
+        self.body = body
+        self.polls = {}
+        self.requests = []
+
+    def url(self, path):
+        return "fake://" + path
+
+    async def post_json(self, path, body):
+        self.requests.append(("POST", path, body))
+        await asyncio.sleep(0)
+        export_id = "exp-{}".format(len(self.polls) + 1)
+        self.polls[export_id] = 0
+        return {"id": export_id}, {}
+
+    async def get_json(self, path):
+        self.requests.append(("GET", path, None))
+        await asyncio.sleep(0)
+        export_id = path.rsplit("/", 1)[1]
+        self.polls[export_id] += 1
+        status = "COMPLETED" if self.polls[export_id] > self.pending_polls else "PENDING"
+        return {"id": export_id, "status": status}, {}
+
+    async def stream(self, path, offset=0, chunk_size=4):
+        self.requests.append(("GET", path, offset))
+        for start in range(offset, len(self.body), chunk_size):
+            await asyncio.sleep(0)
+            yield self.body[start:start + chunk_size]
+
+
+class TestExportEngine(unittest.TestCase):
+    def setUp(self):
+        self.config = {"export_poll_max_interval": 0.01,
+                       "export_window_end_param": "createdOrUpdatedBefore"}
+
+    def test_request_export_creates_and_waits(self):
+        transport = FakeTransport(pending_polls=2)
+        cache = MagicMock()
+        engine = ExportEngine(self.config, transport, cache=cache)
+
+        export_id = asyncio.run(engine.request_export("users", "2025-01-01T00:00:00Z",
+                                                      "2025-02-01T00:00:00Z"))
+
+        self.assertEqual(export_id, "exp-1")
+        self.assertEqual(transport.polls["exp-1"], 3)
+        body = transport.requests[0][2]
+        self.assertEqual(body["type"], "USER")
+        self.assertEqual(body["params"], {"createdOrUpdatedSince": "2025-01-01T00:00:00Z",
+                                          "createdOrUpdatedBefore": "2025-02-01T00:00:00Z"})
+        cache.put.assert_called_once_with("users", "2025-01-01T00:00:00Z", "2025-02-01T00:00:00Z",
+                                          "exp-1", "2025-02-01T00:00:00Z")
+
+    def test_create_export_without_id_raises(self):
+        transport = FakeTransport()
+        transport.post_json = AsyncMock(return_value=({"message": "nope"}, {}))
+        engine = ExportEngine(self.config, transport)
+
+        with self.assertRaises(Exception) as ctx:
+            asyncio.run(engine.create_export("users", "2025-01-01T00:00:00Z"))
+
+        self.assertIn("Request to create users export failed", str(ctx.exception))
+
+    def test_ensure_export_reuses_cached_export(self):
+        transport = FakeTransport()
+        transport.polls["exp-cached"] = 0
+        cache = MagicMock()
+        cache.get.return_value = {"id": "exp-cached", "export_start": "2025-09-01T00:00:00Z"}
+        engine = ExportEngine(self.config, transport, cache=cache)
+
+        result = asyncio.run(engine.ensure_export("users", "2025-01-01T00:00:00Z"))
+
+        self.assertEqual(result, ("2025-09-01T00:00:00Z", "exp-cached"))
+        self.assertEqual([r[0] for r in transport.requests], ["GET"])
+
+    def test_ensure_export_replaces_unavailable_cached_export(self):
+        transport = FakeTransport()
+        transport.get_json = AsyncMock(side_effect=[requests.exceptions.HTTPError(),
+                                                    ({"status": "COMPLETED"}, {})])
+        cache = MagicMock()
+        cache.get.return_value = {"id": "exp-gone", "export_start": "2025-09-01T00:00:00Z"}
+        engine = ExportEngine(self.config, transport, cache=cache)
+
+        export_start, export_id = asyncio.run(engine.ensure_export("users", "2025-01-01T00:00:00Z",
+                                                                   "2025-02-01T00:00:00Z"))
+
+        self.assertEqual((export_start, export_id), ("2025-02-01T00:00:00Z", "exp-1"))
+        cache.remove.assert_called_once_with("users", "2025-01-01T00:00:00Z", "2025-02-01T00:00:00Z")
+
+    def test_wait_for_export_cancelled(self):
+        transport = FakeTransport(pending_polls=100)
+        engine = ExportEngine(self.config, transport)
+        cancelled = threading.Event()
+        cancelled.set()
+
+        with self.assertRaises(Exception) as ctx:
+            asyncio.run(engine.wait_for_export("users", "exp-1", cancelled=cancelled))
+
+        self.assertIn("users export cancelled", str(ctx.exception))
+        self.assertEqual(transport.requests, [])
+
+    def test_wait_for_export_stops_on_asyncio_event(self):
+        transport = FakeTransport(pending_polls=100)
+        transport.polls["exp-1"] = 0
+        engine = ExportEngine({"export_poll_max_interval": 60}, transport)
+
+        async def run():
+            cancelled = asyncio.Event()
+            asyncio.get_running_loop().call_later(0.05, cancelled.set)
+            await engine.wait_for_export("users", "exp-1", cancelled=cancelled)
+
+        with self.assertRaises(Exception) as ctx:
+            asyncio.run(asyncio.wait_for(run(), 5))
+
+        self.assertIn("users export cancelled", str(ctx.exception))
+
+    def test_wait_for_export_records_profile(self):
+        transport = FakeTransport(pending_polls=1)
+        transport.polls["exp-1"] = 0
+        profiler = MagicMock()
+        engine = ExportEngine(self.config, transport, profiler=profiler)
+
+        asyncio.run(engine.wait_for_export("users", "exp-1"))
+
+        self.assertEqual(profiler.add.call_args[0][:2], ("users", "wait"))
+        profiler.count.assert_called_once_with("users", "polls", 2)
+
+    def test_download_streams_from_offset(self):
+        transport = FakeTransport(body=b"id,name\n1,a\n2,b\n")
+        engine = ExportEngine(self.config, transport)
+
+        async def collect():
+            return b"".join([chunk async for chunk in engine.download("exp-1", offset=8)])
+
+        self.assertEqual(asyncio.run(collect()), b"1,a\n2,b\n")
+        self.assertEqual(transport.requests, [("GET", "/export/exp-1/download", 8)])
+
+    def test_iter_async_from_synchronous_code(self):
+        transport = FakeTransport(body=b"id,name\n1,a\n")
+        engine = ExportEngine(self.config, transport)
+
+        self.assertEqual(b"".join(iter_async(engine.download("exp-1"))), b"id,name\n1,a\n")
+
+
+class TestEventLoopThread(unittest.TestCase):
+    def test_exports_overlap_on_one_loop(self):
+        transport = FakeTransport(pending_polls=1)
+        engine = ExportEngine(self.config_for_test(), transport)
+        limit = asyncio.Semaphore(3)
+        loop_thread = EventLoopThread()
+        try:
+            futures = [loop_thread.submit(bounded(limit, engine.request_export(entity, "since")))
+                       for entity in ("users", "referrals", "reward_balances")]
+            export_ids = [future.result(5) for future in futures]
+        finally:
+            loop_thread.close()
+
+        self.assertEqual(sorted(export_ids), ["exp-1", "exp-2", "exp-3"])
+        # Every export is created before the first one is ready
+        last_post = max(i for i, r in enumerate(transport.requests) if r[0] == "POST")
+        first_polls = [i for i, r in enumerate(transport.requests) if r[1] == "/export/exp-1"]
+        self.assertLess(last_post, first_polls[1])
+
+    def test_bounded_limits_in_flight(self):
+        transport = FakeTransport(pending_polls=1)
+        engine = ExportEngine(self.config_for_test(), transport)
+        limit = asyncio.Semaphore(1)
+        loop_thread = EventLoopThread()
+        try:
+            futures = [loop_thread.submit(bounded(limit, engine.request_export("users", "since")))
+                       for _ in range(3)]
+            for future in futures:
+                future.result(5)
+        finally:
+            loop_thread.close()
+
+        self.assertEqual([r[0] for r in transport.requests], ["POST", "GET", "GET"] * 3)
+
+    def test_close_cancels_pending(self):
+        transport = FakeTransport(pending_polls=1000)
+        engine = ExportEngine({"export_poll_max_interval": 60}, transport)
+        loop_thread = EventLoopThread()
+        future = loop_thread.submit(engine.request_export("users", "since"))
+
+        loop_thread.close()
+
+        self.assertTrue(future.cancelled())
+
+    @staticmethod
+    def config_for_test():
+        return {"export_poll_max_interval": 0.01}
+
+
+if __name__ == "__main__":
+    unittest.main()
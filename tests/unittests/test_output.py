@@ -0,0 +1,77 @@
+import io
+import unittest
+from unittest.mock import patch
+
+import singer
+
+from tap_referral_saasquatch import STATE, write_record, write_state
+from tap_referral_saasquatch.output import RecordWriter
+
+
+class TestRecordWriter(unittest.TestCase):
+    def test_lines_match_singer_write_record(self):
+        records = [
+            {"id": "1", "name": "Zoë \"Z\"", "amount": 1500, "dateCreated": None},
+            {"id": "2", "unicode": "☃\nline", "amount": -3},
+        ]
+        expected = io.StringIO()
+        with patch("sys.stdout", expected):
+            for record in records:
+                singer.write_record("users", record)
+
+        actual = io.StringIO()
+        writer = RecordWriter()
+        with patch("sys.stdout", actual):
+            for record in records:
+                writer.write_record("users", record)
+            writer.flush()
+
+        self.assertEqual(actual.getvalue(), expected.getvalue())
+
+    def test_buffers_until_size_threshold(self):
+        out = io.StringIO()
+        writer = RecordWriter(max_buffer_size=200, flush_interval=3600)
+        with patch("sys.stdout", out):
+            writer.write_record("users", {"id": "1"})
+            self.assertEqual(out.getvalue(), "")
+            for i in range(5):
+                writer.write_record("users", {"id": str(i)})
+
+        self.assertGreater(len(out.getvalue()), 0)
+        self.assertTrue(out.getvalue().endswith("\n"))
+
+    def test_flushes_after_interval(self):
+        out = io.StringIO()
+        writer = RecordWriter(max_buffer_size=1 << 20, flush_interval=0)
+        with patch("sys.stdout", out):
+            writer.write_record("users", {"id": "1"})
+
+        self.assertIn('"id": "1"', out.getvalue())
+
+    def test_configure_reads_thresholds(self):
+        writer = RecordWriter()
+        writer.configure({"output_buffer_size": "4096", "output_flush_interval": "0.5"})
+
+        self.assertEqual((writer.max_buffer_size, writer.flush_interval), (4096, 0.5))
+
+
+class TestWriteState(unittest.TestCase):
+    def setUp(self):
+        self.original_state = dict(STATE)
+
+    def tearDown(self):
+        STATE.clear()
+        STATE.update(self.original_state)
+
+    def test_state_is_written_after_buffered_records(self):
+        STATE.clear()
+        STATE["users"] = "2025-01-01T00:00:00Z"
+        out = io.StringIO()
+        with patch("sys.stdout", out):
+            write_record("users", {"id": "1"})
+            write_state()
+
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn('"type": "RECORD"', lines[0])
+        self.assertIn('"type": "STATE"', lines[1])
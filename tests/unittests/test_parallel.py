@@ -0,0 +1,89 @@
+import csv
+import io
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+
+from tap_referral_saasquatch import CONFIG, sync_export
+from tap_referral_saasquatch.parallel import iter_ordered, read_header, row_ranges
+
+from sync_base import SyncTestCase
+
+BODY = (b'id,name,dateCreated\r\n'
+        b'1,"multi\r\nline, with ""quotes""",1735689600000\r\n'
+        b'2,Bob,\r\n'
+        b'3,"a\nb\nc",1735689600123\r\n'
+        b'4,"""quoted""",1735689600000\r\n')
+
+
+def thread_pool(max_workers, mp_context=None):
+    return ThreadPoolExecutor(max_workers=max_workers)
+
+
+class TestRowRanges(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "export.csv")
+        with open(self.path, "wb") as f:
+            f.write(BODY)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_ranges_end_on_row_boundaries(self):
+        expected = list(csv.reader(io.StringIO(BODY.decode(), newline="")))
+        for chunk_bytes in [1, 7, 20, 1000]:
+            header_range, ranges = row_ranges(self.path, chunk_bytes)
+            rows = []
+            for start, end in ranges:
+                rows.extend(csv.reader(io.StringIO(BODY[start:end].decode(), newline="")))
+
+            self.assertEqual(read_header(self.path, header_range), expected[0])
+            self.assertEqual(rows, expected[1:])
+
+    def test_empty_export(self):
+        with open(self.path, "wb"):
+            pass
+
+        header_range, ranges = row_ranges(self.path, 10)
+        self.assertIsNone(header_range)
+        self.assertEqual(list(ranges), [])
+
+
+class TestIterOrdered(unittest.TestCase):
+    def test_results_keep_submission_order(self):
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(iter_ordered(executor, lambda n: n * n, ((n,) for n in range(20)), window=3))
+
+        self.assertEqual(results, [n * n for n in range(20)])
+
+
+class TestParallelSync(SyncTestCase):
+    properties = {"id": {"type": ["null", "string"]},
+                  "dateCreated": {"type": ["null", "string"], "format": "date-time"}}
+
+    def setUp(self):
+        super().setUp()
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    @patch("tap_referral_saasquatch.ProcessPoolExecutor", side_effect=thread_pool)
+    @patch("tap_referral_saasquatch.singer.write_state")
+    @patch("tap_referral_saasquatch.write_record")
+    @patch("tap_referral_saasquatch.export_chunks", side_effect=lambda *args, **kwargs: iter([BODY]))
+    def test_records_are_emitted_in_export_order(self, mock_export_chunks, mock_write_record,
+                                                 mock_write_state, mock_pool):
+        config = {"tenant_alias": "tenant-a", "spool_dir": self.tmp.name,
+                  "parse_workers": "2", "parse_chunk_bytes": "8"}
+        with patch.dict(CONFIG, config):
+            sync_export("users", "export-1", "2025-02-01T00:00:00Z", self.catalog, MagicMock())
+
+        written = [c[0][1] for c in mock_write_record.call_args_list]
+        self.assertEqual([record["id"] for record in written], ["1", "2", "3", "4"])
+        self.assertEqual(written[0]["dateCreated"], "2025-01-01T00:00:00.000000Z")
+        self.assertIsNone(written[1]["dateCreated"])
+        self.assertEqual(os.listdir(self.tmp.name), [])
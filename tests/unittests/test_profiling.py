@@ -0,0 +1,63 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from tap_referral_saasquatch import PROFILER, sync_export
+from tap_referral_saasquatch.profiling import StageProfiler
+
+from sync_base import SyncTestCase
+
+
+class TestStageProfiler(unittest.TestCase):
+    def test_disabled_profiler_passes_through(self):
+        profiler = StageProfiler()
+        rows = iter([1, 2])
+
+        self.assertIs(profiler.timed_iter("users", "parse", rows), rows)
+        self.assertIs(profiler.timed_call("users", "write", len), len)
+        profiler.count("users", "rows", 2)
+        self.assertEqual(profiler.counts, {})
+
+    @patch("tap_referral_saasquatch.profiling.time.perf_counter")
+    def test_nested_stages_report_own_time(self, mock_perf_counter):
+        profiler = StageProfiler()
+        profiler.configure({"profile_stages": "true"})
+        # parse starts at 0, download runs from 1 to 4, parse ends at 10
+        mock_perf_counter.side_effect = [0.0, 1.0, 4.0, 10.0]
+
+        with profiler.stage("users", "parse"):
+            with profiler.stage("users", "download"):
+                pass
+
+        self.assertEqual(profiler.seconds["users"], {"download": 3.0, "parse": 7.0})
+
+    def test_timed_iter_counts_item_sizes(self):
+        profiler = StageProfiler()
+        profiler.configure({"profile_stages": "true"})
+
+        self.assertEqual(list(profiler.timed_iter("users", "download", [b"ab", b"cde"], counter="bytes")),
+                         [b"ab", b"cde"])
+        self.assertEqual(profiler.counts["users"]["bytes"], 5)
+        self.assertIn("download", profiler.seconds["users"])
+
+
+class TestProfiledSync(SyncTestCase):
+    def tearDown(self):
+        PROFILER.configure({})
+
+    @patch("tap_referral_saasquatch.profiling.metrics.log")
+    @patch("tap_referral_saasquatch.singer.write_state")
+    @patch("tap_referral_saasquatch.write_record")
+    @patch("tap_referral_saasquatch.export_rows", return_value=(["id"], iter([("1",), ("2",)])))
+    def test_sync_export_records_stages(self, mock_export_rows, mock_write_record, mock_write_state,
+                                        mock_log):
+        PROFILER.configure({"profile_stages": "true"})
+
+        sync_export("users", "export-1", "2025-02-01T00:00:00Z", self.catalog, MagicMock())
+        PROFILER.emit()
+
+        self.assertEqual(mock_write_record.call_count, 2)
+        self.assertEqual(PROFILER.counts["users"]["rows"], 2)
+        self.assertEqual(set(PROFILER.seconds["users"]), {"parse", "transform", "write"})
+        points = {(c[0][1].metric, c[0][1].tags.get("stage")) for c in mock_log.call_args_list}
+        self.assertIn(("stage_duration", "write"), points)
+        self.assertIn(("rows", None), points)
@@ -0,0 +1,100 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+from tap_referral_saasquatch import CONFIG, STATE, stream_export, sync_export
+from tap_referral_saasquatch.spool import iter_spooled_lines, partial_size, spool_download, spool_path
+
+from sync_base import mock_catalog
+
+
+def make_download(chunks):
+    download = MagicMock()
+    download.iter_content.return_value = iter(chunks)
+    return download
+
+
+class TestSpool(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = spool_path(self.tmp.name, "tenant-a", "exp-1")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_spool_download_renames_completed_file(self):
+        spool_download([b"id\n", b"1\n"], self.path)
+
+        self.assertFalse(os.path.exists(self.path + ".part"))
+        with open(self.path, "rb") as spool:
+            self.assertEqual(spool.read(), b"id\n1\n")
+
+    def test_spool_download_appends_to_partial_file(self):
+        with open(self.path + ".part", "wb") as part:
+            part.write(b"id\n")
+        self.assertEqual(partial_size(self.path), 3)
+
+        spool_download([b"1\n"], self.path)
+
+        self.assertEqual(list(iter_spooled_lines(self.path)), [b"id\n", b"1\n"])
+
+    def test_spool_download_creates_spool_dir(self):
+        path = spool_path(os.path.join(self.tmp.name, "missing", "spool"), "tenant-a", "exp-1")
+
+        spool_download([b"id\n"], path)
+
+        with open(path, "rb") as spool:
+            self.assertEqual(spool.read(), b"id\n")
+
+    @patch("tap_referral_saasquatch.singer.write_state")
+    @patch("tap_referral_saasquatch.write_record")
+    @patch("tap_referral_saasquatch.export_rows", return_value=(["id"], iter([("1",)])))
+    def test_replaced_export_spool_is_removed(self, mock_export_rows, mock_write_record, mock_write_state):
+        stale = spool_path(self.tmp.name, "tenant-a", "exp-0")
+        for path in (stale, stale + ".part", self.path + ".part"):
+            open(path, "wb").close()
+        with patch.dict(CONFIG, {"tenant_alias": "tenant-a", "spool_dir": self.tmp.name}), \
+                patch.dict(STATE, {"current_exports": {"users": {
+                    "id": "exp-0", "export_start": "2025-02-01T00:00:00Z", "rows": 5}}}):
+            sync_export("users", "exp-1", "2025-03-01T00:00:00Z", mock_catalog(), MagicMock())
+
+        self.assertEqual(os.listdir(self.tmp.name), ["tenant-a-exp-1.csv.part"])
+
+    def test_iter_spooled_lines_empty_file(self):
+        open(self.path, "wb").close()
+
+        self.assertEqual(list(iter_spooled_lines(self.path)), [])
+
+    @patch("tap_referral_saasquatch.engine.ResumableDownload")
+    def test_stream_export_parses_spool_and_removes_it(self, mock_download_cls):
+        mock_download_cls.return_value = make_download([b'id,name\r\n1,"multi\r\nline"\r\n2,Bob\r\n'])
+
+        with patch.dict(CONFIG, {"tenant_alias": "tenant-a", "spool_dir": self.tmp.name}):
+            rows = list(stream_export("users", "exp-1"))
+
+        self.assertEqual(rows, [{"id": "1", "name": "multi\r\nline"}, {"id": "2", "name": "Bob"}])
+        self.assertEqual(mock_download_cls.call_args[1]["offset"], 0)
+        self.assertFalse(os.path.exists(self.path))
+
+    @patch("tap_referral_saasquatch.engine.ResumableDownload")
+    def test_stream_export_reuses_existing_spool(self, mock_download_cls):
+        with open(self.path, "wb") as spool:
+            spool.write(b"id\n7\n")
+
+        with patch.dict(CONFIG, {"tenant_alias": "tenant-a", "spool_dir": self.tmp.name}):
+            rows = list(stream_export("users", "exp-1"))
+
+        self.assertEqual(rows, [{"id": "7"}])
+        mock_download_cls.assert_not_called()
+
+    @patch("tap_referral_saasquatch.engine.ResumableDownload")
+    def test_failed_parse_keeps_spool(self, mock_download_cls):
+        mock_download_cls.return_value = make_download([b"id\n1\n2\n"])
+
+        with patch.dict(CONFIG, {"tenant_alias": "tenant-a", "spool_dir": self.tmp.name}):
+            rows = stream_export("users", "exp-1")
+            next(rows)
+            rows.close()
+
+        self.assertTrue(os.path.exists(self.path))
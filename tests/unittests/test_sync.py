@@ -1,7 +1,22 @@
+import asyncio
+import datetime
+import time
 import unittest
 from unittest.mock import MagicMock, patch
 
-from tap_referral_saasquatch import do_sync, sync_entity
+from tap_referral_saasquatch import (
+    CONFIG,
+    STATE,
+    do_sync,
+    export_entity,
+    export_windows,
+    stream_export,
+    sync_entities_concurrently,
+    sync_entity,
+    sync_export,
+)
+
+from sync_base import SyncTestCase
 
 
 class TestSync(unittest.TestCase):
@@ -9,8 +24,8 @@ class TestSync(unittest.TestCase):
     @patch("tap_referral_saasquatch.utils.update_state")
     @patch("tap_referral_saasquatch.write_record")
     @patch("tap_referral_saasquatch.metadata.to_map", return_value={})
-    @patch("tap_referral_saasquatch.stream_export")
-    @patch("tap_referral_saasquatch.request_export")
+    @patch("tap_referral_saasquatch.export_rows")
+    @patch("tap_referral_saasquatch.ENGINE.request_export")
     @patch("tap_referral_saasquatch.load_schema")
     @patch("tap_referral_saasquatch.singer.write_schema")
     @patch("tap_referral_saasquatch.get_start", return_value="2025-01-01T00:00:00Z")
@@ -20,7 +35,7 @@ class TestSync(unittest.TestCase):
         mock_write_schema,
         mock_load_schema,
         mock_request_export,
-        mock_stream_export,
+        mock_export_rows,
         mock_metadata_map,
         mock_write_record,
         mock_update_state,
@@ -28,7 +43,7 @@ class TestSync(unittest.TestCase):
     ):
         mock_load_schema.return_value = {"type": "object", "properties": {"id": {"type": "string"}}}
         mock_request_export.return_value = "export-1"
-        mock_stream_export.return_value = [{"id": "1", "name": "Alice"}, {"id": "2", "name": "Bob"}]
+        mock_export_rows.return_value = (["id", "name"], iter([("1", "Alice"), ("2", "Bob")]))
 
         mock_catalog_stream = MagicMock()
         mock_catalog_stream.schema.to_dict.return_value = {
@@ -45,15 +60,17 @@ class TestSync(unittest.TestCase):
 
         sync_entity("users", ["id", "accountId"], catalog, transformer)
 
-        mock_get_start.assert_called_once_with("users")
+        mock_get_start.assert_called_with("users")
         mock_write_schema.assert_called_once_with(
             "users", {"type": "object", "properties": {"id": {"type": "string"}}}, ["id", "accountId"]
         )
-        mock_request_export.assert_called_once_with("users")
-        mock_stream_export.assert_called_once_with("users", "export-1")
+        mock_request_export.assert_called_once_with(
+            "users", "2025-01-01T00:00:00Z", None, cancelled=None)
+        mock_export_rows.assert_called_once_with("users", "export-1", fields=["id", "name"])
         self.assertEqual(mock_write_record.call_count, 2)
         mock_update_state.assert_called_once()
-        mock_write_state.assert_called_once()
+        # once to record the export being downloaded, once to advance the bookmark
+        self.assertEqual(mock_write_state.call_count, 2)
 
     @patch("tap_referral_saasquatch.sync_entity")
     @patch("tap_referral_saasquatch.singer.Transformer")
@@ -81,3 +98,308 @@ class TestSync(unittest.TestCase):
         mock_sync_entity.assert_any_call("users", ["id", "accountId"], catalog, transformer)
         mock_sync_entity.assert_any_call("referrals", ["id"], catalog, transformer)
         mock_sync_entity.assert_any_call("reward_balances", ["userId", "accountId"], catalog, transformer)
+
+    @patch("tap_referral_saasquatch.CLIENT.get")
+    def test_stream_export_yields_rows_lazily(self, mock_get):
+        response = MagicMock()
+        response.headers = {}
+        response.iter_content.return_value = iter([b"id,name\n1,Ali", b"ce\n2,Bob\n"])
+        mock_get.return_value.__enter__.return_value = response
+
+        with patch.dict(CONFIG, {"api_key": "dummy-key", "tenant_alias": "tenant-a"}):
+            rows = stream_export("users", "export-1")
+            mock_get.assert_not_called()
+
+            self.assertEqual(next(rows), {"id": "1", "name": "Alice"})
+            self.assertEqual(list(rows), [{"id": "2", "name": "Bob"}])
+
+    @patch("tap_referral_saasquatch.CLIENT.get")
+    def test_stream_export_keeps_quoted_newlines_and_split_characters(self, mock_get):
+        body = 'id,name\r\n1,"first\r\nsecond"\r\n2,"Zo\u00eb\nB"\r\n'.encode("utf-8")
+        split = body.index("\u00eb".encode("utf-8")) + 1
+        response = MagicMock()
+        response.headers = {}
+        response.iter_content.return_value = iter([body[:7], body[7:split], body[split:]])
+        mock_get.return_value.__enter__.return_value = response
+
+        with patch.dict(CONFIG, {"api_key": "dummy-key", "tenant_alias": "tenant-a"}):
+            rows = list(stream_export("users", "export-1"))
+
+        self.assertEqual(rows, [{"id": "1", "name": "first\r\nsecond"}, {"id": "2", "name": "Zo\u00eb\nB"}])
+
+    @patch("tap_referral_saasquatch.CLIENT.get")
+    def test_stream_export_projects_selected_columns(self, mock_get):
+        response = MagicMock()
+        response.headers = {}
+        response.iter_content.return_value = iter([b"id,name,email\n1,Alice,a@x\n2,Bob\n"])
+        mock_get.return_value.__enter__.return_value = response
+
+        with patch.dict(CONFIG, {"api_key": "dummy-key", "tenant_alias": "tenant-a"}):
+            rows = list(stream_export("users", "export-1", fields=["email", "id"]))
+
+        self.assertEqual(rows, [{"id": "1", "email": "a@x"}, {"id": "2"}])
+
+    @patch("tap_referral_saasquatch.CLIENT.get")
+    def test_stream_export_empty_download(self, mock_get):
+        response = MagicMock()
+        response.headers = {}
+        response.iter_content.return_value = iter([])
+        mock_get.return_value.__enter__.return_value = response
+
+        with patch.dict(CONFIG, {"api_key": "dummy-key", "tenant_alias": "tenant-a"}):
+            self.assertEqual(list(stream_export("users", "export-1")), [])
+
+    @patch("tap_referral_saasquatch.sync_entities_concurrently")
+    @patch("tap_referral_saasquatch.sync_entity")
+    @patch("tap_referral_saasquatch.singer.Transformer")
+    def test_do_sync_uses_concurrent_mode_when_configured(
+        self, mock_transformer_cls, mock_sync_entity, mock_sync_concurrently
+    ):
+        transformer = MagicMock()
+        mock_transformer_cls.return_value.__enter__.return_value = transformer
+
+        stream_users = MagicMock()
+        stream_users.stream = "users"
+        stream_referrals = MagicMock()
+        stream_referrals.stream = "referrals"
+        catalog = MagicMock()
+        catalog.get_selected_streams.return_value = [stream_users, stream_referrals]
+
+        with patch.dict(CONFIG, {"max_concurrent_exports": "3"}):
+            do_sync(catalog)
+
+        mock_sync_entity.assert_not_called()
+        mock_sync_concurrently.assert_called_once()
+        args = mock_sync_concurrently.call_args[0]
+        self.assertEqual(args[0], ["users", "referrals"])
+        self.assertEqual(args[4], 3)
+
+    @patch("tap_referral_saasquatch.export_windows", return_value=[(None, None)])
+    @patch("tap_referral_saasquatch.sync_export")
+    @patch("tap_referral_saasquatch.prepare_export")
+    @patch("tap_referral_saasquatch.write_entity_schema")
+    def test_sync_entities_concurrently_emits_in_completion_order(
+        self, mock_write_schema, mock_prepare_export, mock_sync_export, mock_export_windows
+    ):
+        users_requested = asyncio.Event()
+
+        async def prepare_export(entity, since, until):
+            if entity == "users":
+                users_requested.set()
+                return "start-users", "export-users"
+            # referrals only becomes ready after users has been requested
+            await users_requested.wait()
+            await asyncio.sleep(0.05)
+            return "start-referrals", "export-referrals"
+
+        mock_prepare_export.side_effect = prepare_export
+        key_properties = {"referrals": ["id"], "users": ["id", "accountId"]}
+        catalog = MagicMock()
+        transformer = MagicMock()
+
+        sync_entities_concurrently(["referrals", "users"], key_properties, catalog, transformer, 2)
+
+        self.assertEqual(mock_write_schema.call_count, 2)
+        emitted = [c[0][0] for c in mock_sync_export.call_args_list]
+        self.assertEqual(emitted, ["users", "referrals"])
+        mock_sync_export.assert_any_call("users", "export-users", "start-users", catalog, transformer,
+                                         since=None, until=None)
+
+    @patch("tap_referral_saasquatch.export_windows", return_value=[(None, None)])
+    @patch("tap_referral_saasquatch.sync_export")
+    @patch("tap_referral_saasquatch.prepare_export")
+    @patch("tap_referral_saasquatch.write_entity_schema")
+    def test_sync_entities_concurrently_cancels_on_failure(
+        self, mock_write_schema, mock_prepare_export, mock_sync_export, mock_export_windows
+    ):
+        cancelled = []
+
+        async def prepare_export(entity, since, until):
+            if entity == "users":
+                raise Exception("boom")
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.append(entity)
+                raise
+            return "start", "export"
+
+        mock_prepare_export.side_effect = prepare_export
+
+        started = time.monotonic()
+        with self.assertRaises(Exception):
+            sync_entities_concurrently(["users", "referrals"], {"users": [], "referrals": []},
+                                       MagicMock(), MagicMock(), 2)
+
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(cancelled, ["referrals"])
+        mock_sync_export.assert_not_called()
+
+
+class TestResumableExports(SyncTestCase):
+    @patch("tap_referral_saasquatch.ENGINE.request_export")
+    @patch("tap_referral_saasquatch.ENGINE.export_status", return_value=(True, None))
+    def test_export_entity_reuses_export_from_state(self, mock_export_ready, mock_request_export):
+        STATE["current_exports"] = {
+            "users": {"id": "export-1", "export_start": "2025-02-01T00:00:00Z", "rows": 10}
+        }
+
+        self.assertEqual(export_entity("users"), ("2025-02-01T00:00:00Z", "export-1"))
+        mock_request_export.assert_not_called()
+
+    @patch("tap_referral_saasquatch.ENGINE.request_export", return_value="export-2")
+    @patch("tap_referral_saasquatch.ENGINE.export_status", return_value=(False, None))
+    def test_export_entity_requests_new_export_when_previous_unavailable(
+        self, mock_export_ready, mock_request_export
+    ):
+        STATE["current_exports"] = {
+            "users": {"id": "export-1", "export_start": "2025-02-01T00:00:00Z", "rows": 10}
+        }
+
+        self.assertEqual(export_entity("users")[1], "export-2")
+        mock_request_export.assert_called_once_with("users", STATE["users"], None, cancelled=None)
+
+    @patch("tap_referral_saasquatch.singer.write_state")
+    @patch("tap_referral_saasquatch.write_record")
+    @patch("tap_referral_saasquatch.export_rows")
+    def test_sync_export_skips_rows_already_synced(self, mock_export_rows, mock_write_record, mock_write_state):
+        STATE["current_exports"] = {
+            "users": {"id": "export-1", "export_start": "2025-02-01T00:00:00Z", "rows": 2}
+        }
+        mock_export_rows.return_value = (["id"], iter([(str(i),) for i in range(5)]))
+
+        sync_export("users", "export-1", "2025-02-01T00:00:00Z", self.catalog, MagicMock())
+
+        written = [c[0][1]["id"] for c in mock_write_record.call_args_list]
+        self.assertEqual(written, ["2", "3", "4"])
+        self.assertEqual(STATE, {"users": "2025-02-01T00:00:00Z"})
+
+    @patch("tap_referral_saasquatch.singer.write_state")
+    @patch("tap_referral_saasquatch.write_record")
+    @patch("tap_referral_saasquatch.export_rows")
+    def test_sync_export_records_offset_on_failure(self, mock_export_rows, mock_write_record, mock_write_state):
+        def rows():
+            yield ("1",)
+            yield ("2",)
+            raise ConnectionError("download failed")
+
+        mock_export_rows.return_value = (["id"], rows())
+
+        with patch("tap_referral_saasquatch.TRANSFORM_BATCH_SIZE", 1), self.assertRaises(ConnectionError):
+            sync_export("users", "export-1", "2025-02-01T00:00:00Z", self.catalog, MagicMock())
+
+        self.assertEqual(mock_write_record.call_count, 2)
+        self.assertEqual(STATE["current_exports"]["users"],
+                         {"id": "export-1", "export_start": "2025-02-01T00:00:00Z", "rows": 2,
+                          "since": None, "until": None})
+        self.assertNotIn("users", STATE)
+
+    @patch("tap_referral_saasquatch.singer.write_state")
+    @patch("tap_referral_saasquatch.write_record")
+    @patch("tap_referral_saasquatch.export_rows")
+    def test_sync_export_checkpoints_row_offset(self, mock_export_rows, mock_write_record, mock_write_state):
+        mock_export_rows.return_value = (["id"], iter([(str(i),) for i in range(5)]))
+        checkpoints = []
+        mock_write_state.side_effect = lambda state: checkpoints.append(
+            state.get("current_exports", {}).get("users", {}).get("rows"))
+
+        with patch.dict(CONFIG, {"checkpoint_rows": "2", "checkpoint_interval": "0"}):
+            sync_export("users", "export-1", "2025-02-01T00:00:00Z", self.catalog, MagicMock())
+
+        # start of download, every two rows, then the final bookmark
+        self.assertEqual(checkpoints, [0, 2, 4, None])
+
+
+class TestBackfillWindows(SyncTestCase):
+    def setUp(self):
+        super().setUp()
+        CONFIG.update({"start_date": "2025-01-01T00:00:00Z", "export_window_days": "30",
+                       "export_window_end_param": "createdOrUpdatedBefore"})
+
+    @patch("tap_referral_saasquatch.datetime")
+    def test_export_windows_splits_range(self, mock_datetime):
+        mock_datetime.UTC = datetime.UTC
+        mock_datetime.timedelta = datetime.timedelta
+        mock_datetime.datetime.now.return_value = datetime.datetime(2025, 3, 15, tzinfo=datetime.UTC)
+
+        windows = export_windows("users")
+
+        self.assertEqual(windows, [
+            ("2025-01-01T00:00:00Z", "2025-01-31T00:00:00.000000Z"),
+            ("2025-01-31T00:00:00.000000Z", "2025-03-02T00:00:00.000000Z"),
+            ("2025-03-02T00:00:00.000000Z", None),
+        ])
+
+    def test_export_windows_disabled(self):
+        CONFIG["export_window_days"] = "0"
+
+        self.assertEqual(export_windows("users"), [("2025-01-01T00:00:00Z", None)])
+
+    def test_export_windows_require_end_param(self):
+        del CONFIG["export_window_end_param"]
+
+        self.assertEqual(export_windows("users"), [("2025-01-01T00:00:00Z", None)])
+
+    @patch("tap_referral_saasquatch.singer.write_state")
+    @patch("tap_referral_saasquatch.singer.write_schema")
+    @patch("tap_referral_saasquatch.write_record")
+    @patch("tap_referral_saasquatch.export_rows",
+           side_effect=lambda entity, export_id, fields=None: (["id"], iter([(export_id,)])))
+    @patch("tap_referral_saasquatch.ENGINE.request_export", side_effect=["export-1", "export-2"])
+    @patch("tap_referral_saasquatch.export_windows",
+           return_value=[("2025-01-01T00:00:00Z", "2025-01-31T00:00:00Z"), ("2025-01-31T00:00:00Z", None)])
+    def test_sync_entity_advances_bookmark_per_window(
+        self, mock_windows, mock_request_export, mock_export_rows, mock_write_record,
+        mock_write_schema, mock_write_state
+    ):
+        bookmarks = []
+        mock_write_state.side_effect = lambda state: bookmarks.append(state.get("users"))
+        catalog = MagicMock()
+        catalog.metadata = []
+        catalog.get_stream.return_value.schema.to_dict.return_value = {
+            "type": "object", "properties": {"id": {"type": ["null", "string"]}}}
+
+        sync_entity("users", ["id"], catalog, MagicMock())
+
+        self.assertEqual(mock_request_export.call_args_list[0][0],
+                         ("users", "2025-01-01T00:00:00Z", "2025-01-31T00:00:00Z"))
+        self.assertEqual(mock_request_export.call_args_list[1][0][2], None)
+        self.assertEqual(bookmarks[1], "2025-01-31T00:00:00Z")
+        self.assertNotEqual(bookmarks[-1], "2025-01-31T00:00:00Z")
+
+    @patch("tap_referral_saasquatch.ENGINE.request_export")
+    @patch("tap_referral_saasquatch.ENGINE.export_status", return_value=(True, None))
+    def test_export_entity_only_resumes_matching_window(self, mock_export_ready, mock_request_export):
+        STATE["current_exports"] = {"users": {
+            "id": "export-1", "export_start": "2025-01-31T00:00:00Z", "rows": 5,
+            "since": "2025-01-01T00:00:00Z", "until": "2025-01-31T00:00:00Z"}}
+        mock_request_export.return_value = "export-2"
+
+        self.assertEqual(export_entity("users", since="2025-01-01T00:00:00Z", until="2025-01-31T00:00:00Z"),
+                         ("2025-01-31T00:00:00Z", "export-1"))
+        self.assertEqual(export_entity("users", since="2025-01-01T00:00:00Z", until="2025-01-15T00:00:00Z"),
+                         ("2025-01-15T00:00:00Z", "export-2"))
+
+    @patch("tap_referral_saasquatch.export_windows",
+           return_value=[("a", "b"), ("b", "c"), ("c", None)])
+    @patch("tap_referral_saasquatch.sync_export")
+    @patch("tap_referral_saasquatch.prepare_export")
+    @patch("tap_referral_saasquatch.write_entity_schema")
+    def test_concurrent_windows_are_emitted_in_order(
+        self, mock_write_schema, mock_prepare_export, mock_sync_export, mock_export_windows
+    ):
+        first_window_may_finish = asyncio.Event()
+
+        async def prepare_export(entity, since, until):
+            if since == "a":
+                await first_window_may_finish.wait()
+            else:
+                first_window_may_finish.set()
+            return until or "now", "export-" + since
+
+        mock_prepare_export.side_effect = prepare_export
+
+        sync_entities_concurrently(["users"], {"users": ["id"]}, MagicMock(), MagicMock(), 3)
+
+        emitted = [c[0][1] for c in mock_sync_export.call_args_list]
+        self.assertEqual(emitted, ["export-a", "export-b", "export-c"])
@@ -0,0 +1,119 @@
+import unittest
+from concurrent.futures import Future
+from unittest.mock import MagicMock, patch
+
+from tap_referral_saasquatch import (
+    CONFIG,
+    PREFETCHED_EXPORTS,
+    STATE,
+    do_multi_tenant_sync,
+    export_entity,
+    tenant_configs,
+    write_record,
+)
+
+
+class TestMultiTenantSync(unittest.TestCase):
+    def setUp(self):
+        self.original_config = dict(CONFIG)
+        self.original_state = dict(STATE)
+        CONFIG.update({
+            "api_key": None,
+            "tenant_alias": None,
+            "start_date": "2025-01-01T00:00:00Z",
+            "max_concurrent_tenants": 2,
+            "tenants": [
+                {"tenant_alias": "tenant-a", "api_key": "key-a"},
+                {"tenant_alias": "tenant-b", "api_key": "key-b", "start_date": "2025-06-01T00:00:00Z"},
+            ],
+        })
+        STATE.clear()
+
+    def tearDown(self):
+        CONFIG.clear()
+        CONFIG.update(self.original_config)
+        STATE.clear()
+        STATE.update(self.original_state)
+        PREFETCHED_EXPORTS.clear()
+
+    def test_tenant_configs_layer_tenant_keys_over_config(self):
+        configs = tenant_configs()
+
+        self.assertEqual([c["tenant_alias"] for c in configs], ["tenant-a", "tenant-b"])
+        self.assertEqual(configs[0]["start_date"], "2025-01-01T00:00:00Z")
+        self.assertEqual(configs[1]["start_date"], "2025-06-01T00:00:00Z")
+        self.assertEqual(configs[1]["api_key"], "key-b")
+        self.assertEqual(configs[0]["stream_prefix"], "tenant-a__")
+        self.assertNotIn("tenants", configs[0])
+
+    def test_tenant_configs_keep_alias_in_top_level_stream_prefix(self):
+        CONFIG["stream_prefix"] = "prod_"
+        CONFIG["tenants"].append({"tenant_alias": "tenant-c", "api_key": "key-c",
+                                  "stream_prefix": "c_"})
+
+        configs = tenant_configs()
+
+        self.assertEqual([c["stream_prefix"] for c in configs],
+                         ["prod_tenant-a__", "prod_tenant-b__", "c_"])
+
+    def test_tenant_configs_reject_missing_keys_and_duplicates(self):
+        CONFIG["tenants"] = [{"tenant_alias": "tenant-a"}]
+        with self.assertRaises(Exception):
+            tenant_configs()
+
+        CONFIG["tenants"] = [{"tenant_alias": "tenant-a", "api_key": "k"}] * 2
+        with self.assertRaises(Exception):
+            tenant_configs()
+
+    @patch("tap_referral_saasquatch.singer.write_state")
+    @patch("tap_referral_saasquatch.prefetch_tenant_exports")
+    @patch("tap_referral_saasquatch.prefetch_jobs", return_value=[("users", "2025-01-01T00:00:00Z", None)])
+    @patch("tap_referral_saasquatch.do_sync")
+    def test_do_multi_tenant_sync_namespaces_state(
+        self, mock_do_sync, mock_prefetch_jobs, mock_prefetch, mock_write_state
+    ):
+        STATE["tenants"] = {"tenant-b": {"users": "2025-07-01T00:00:00Z"}}
+        seen = []
+
+        def do_sync(catalog):
+            seen.append((CONFIG["tenant_alias"], CONFIG["api_key"], dict(STATE)))
+            STATE["users"] = "2025-09-01T00:00:00Z"
+
+        mock_do_sync.side_effect = do_sync
+
+        do_multi_tenant_sync(MagicMock())
+
+        self.assertEqual(seen, [("tenant-a", "key-a", {}),
+                                ("tenant-b", "key-b", {"users": "2025-07-01T00:00:00Z"})])
+        self.assertEqual(STATE, {"tenants": {"tenant-a": {"users": "2025-09-01T00:00:00Z"},
+                                             "tenant-b": {"users": "2025-09-01T00:00:00Z"}}})
+        self.assertIsNone(CONFIG["tenant_alias"])
+        # Both tenants fit in max_concurrent_tenants, so both are prefetched
+        # before the first one syncs
+        self.assertEqual([c[0][1]["tenant_alias"] for c in mock_prefetch.call_args_list],
+                         ["tenant-a", "tenant-b"])
+
+    @patch("tap_referral_saasquatch.ENGINE.ensure_export")
+    def test_export_entity_uses_prefetched_export(self, mock_ensure_export):
+        CONFIG["tenant_alias"] = "tenant-a"
+        future = Future()
+        future.set_result(("2025-09-01T00:00:00Z", "exp-prefetched"))
+        PREFETCHED_EXPORTS[("tenant-a", "users", "2025-01-01T00:00:00Z", None)] = future
+
+        result = export_entity("users", since="2025-01-01T00:00:00Z")
+
+        self.assertEqual(result, ("2025-09-01T00:00:00Z", "exp-prefetched"))
+        mock_ensure_export.assert_not_called()
+        self.assertEqual(PREFETCHED_EXPORTS, {})
+
+    @patch("tap_referral_saasquatch.OUTPUT")
+    def test_write_record_prefixes_stream(self, mock_output):
+        CONFIG["stream_prefix"] = "tenant-a__"
+
+        write_record("users", {"id": "1"})
+
+        mock_output.write_record.assert_called_once_with("tenant-a__users", {"id": "1"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,161 @@
+import unittest
+from unittest.mock import patch
+
+import singer
+from singer import metadata
+from singer.transform import SchemaMismatch
+
+from tap_referral_saasquatch import transform_records
+from tap_referral_saasquatch.discover import discover
+from tap_referral_saasquatch.transform import (
+    column_transforms,
+    compile_transformer,
+    transform_row,
+    transform_timestamp,
+    transform_timestamps,
+    transform_values,
+)
+
+
+def compiled_transform(transformer, row):
+    return transformer.transform_values_batch(list(row), [tuple(row.values())])[0]
+
+
+def singer_transform(entity, row, mdata):
+    catalog_stream = discover().get_stream(entity)
+    with singer.Transformer() as transformer:
+        return transformer.transform(transform_row(entity, row), catalog_stream.schema.to_dict(), mdata)
+
+
+class TestCompiledTransformer(unittest.TestCase):
+    def setUp(self):
+        self.catalog = discover()
+
+    def compile(self, entity, mdata=None):
+        schema = self.catalog.get_stream(entity).schema.to_dict()
+        if mdata is None:
+            mdata = metadata.to_map(self.catalog.get_stream(entity).metadata)
+        return compile_transformer(entity, schema, mdata), mdata
+
+    def test_matches_singer_transformer_for_referrals(self):
+        transformer, mdata = self.compile("referrals")
+        row = {
+            "id": "r-1",
+            "programId": "",
+            "referredUser": "u-2",
+            "dateReferralStarted": "1735689600000",
+            "dateConverted": "1735689600123",
+            "dateReferralPaid": "",
+            "dateReferralEnded": "",
+            "dateModerated": "1700000000999",
+        }
+
+        self.assertEqual(compiled_transform(transformer, row), singer_transform("referrals", row, mdata))
+        self.assertEqual(compiled_transform(transformer, row)["dateConverted"], "2025-01-01T00:00:00.123000Z")
+
+    def test_matches_singer_transformer_for_reward_balance_amounts(self):
+        transformer, mdata = self.compile("reward_balances")
+        for amount in ["1500", "1,500", ""]:
+            row = {"userId": "u-1", "accountId": "a-1", "type": "CREDIT", "amount": amount, "unit": "CENTS"}
+            expected = singer.Transformer().transform(
+                dict(row), self.catalog.get_stream("reward_balances").schema.to_dict(), mdata)
+            self.assertEqual(compiled_transform(transformer, row), expected)
+
+    def test_drops_unselected_and_unknown_fields(self):
+        mdata = metadata.to_map(self.catalog.get_stream("users").metadata)
+        mdata = metadata.write(mdata, ("properties", "email"), "selected", False)
+        mdata = metadata.write(mdata, ("properties", "dateCreated"), "selected", False)
+        transformer, _ = self.compile("users", mdata)
+
+        record = compiled_transform(transformer, {"id": "u-1", "email": "a@b.c", "dateCreated": "", "extra": "x"})
+
+        self.assertEqual(record, {"id": "u-1", "dateCreated": None})
+
+    def test_invalid_integer_raises_schema_mismatch(self):
+        transformer, _ = self.compile("reward_balances")
+
+        with self.assertRaises(SchemaMismatch):
+            compiled_transform(transformer, {"amount": "lots"})
+
+    def test_unsupported_schema_returns_none(self):
+        schema = {"type": "object", "properties": {"tags": {"type": ["null", "array"]}}}
+
+        self.assertIsNone(compile_transformer("users", schema, {}))
+
+
+class TestBatchTimestamps(unittest.TestCase):
+    VALUES = [
+        "1735689600000",
+        "1735689600123",
+        "0",
+        "951782400999",
+        "4102444799999",
+        "4102444800000",
+        "-1",
+        "",
+        None,
+    ] + [str(1483228800000 + step * 7919 * 1000003) for step in range(200)]
+
+    def assert_matches_transform_timestamp(self):
+        self.assertEqual(transform_timestamps(self.VALUES),
+                         [transform_timestamp(value) for value in self.VALUES])
+
+    def test_matches_transform_timestamp(self):
+        self.assert_matches_transform_timestamp()
+
+    def test_matches_transform_timestamp_without_numpy(self):
+        with patch("tap_referral_saasquatch.transform.numpy", None):
+            self.assert_matches_transform_timestamp()
+
+    def test_invalid_value_uses_fallback(self):
+        with self.assertRaises(ValueError):
+            transform_timestamps(["1735689600000", "not a number"])
+
+        self.assertEqual(transform_timestamps(["abc"], fallback=lambda value: "fallback"), ["fallback"])
+
+    def test_transform_values_batch_matches_single_rows(self):
+        catalog_stream = discover().get_stream("referrals")
+        mdata = metadata.to_map(catalog_stream.metadata)
+        transformer = compile_transformer("referrals", catalog_stream.schema.to_dict(), mdata)
+        names = ["id", "dateReferralStarted", "dateConverted"]
+        rows = [(str(index), value, "") for index, value in enumerate(self.VALUES)]
+        rows.append(("short row",))
+
+        self.assertEqual(transformer.transform_values_batch(names, rows),
+                         [transformer.transform_values_batch(names, [values])[0] for values in rows])
+
+    def test_transform_values_batch_invalid_timestamp_raises_schema_mismatch(self):
+        catalog_stream = discover().get_stream("users")
+        transformer = compile_transformer("users", catalog_stream.schema.to_dict(), {})
+
+        with self.assertRaises(SchemaMismatch):
+            transformer.transform_values_batch(["dateCreated"], [("1735689600000",), ("garbage",)])
+
+
+class TestColumnTransforms(unittest.TestCase):
+    def test_transforms_are_applied_by_column_index(self):
+        names = ["userId", "amount", "unknown"]
+        transforms = column_transforms("reward_balances", names)
+
+        self.assertEqual(transforms, [(1, int)])
+        self.assertEqual(transform_values(("u-1", "250", "x"), transforms), ["u-1", 250, "x"])
+        self.assertEqual(transform_values(("u-1", ""), transforms), ["u-1", None])
+        self.assertEqual(transform_values(("u-1", "lots"), transforms), ["u-1", "lots"])
+        self.assertEqual(transform_values(("u-1",), transforms), ["u-1"])
+        self.assertEqual(transform_row("reward_balances", {"userId": "u-1", "amount": "250"}),
+                         {"userId": "u-1", "amount": 250})
+
+    @patch("tap_referral_saasquatch.compile_transformer", return_value=None)
+    def test_singer_transformer_fallback_gets_converted_values(self, mock_compile):
+        catalog_stream = discover().get_stream("referrals")
+        mdata = metadata.to_map(catalog_stream.metadata)
+        names = ["id", "dateReferralStarted", "dateConverted"]
+        rows = [("r-1", "1735689600000", ""), ("r-2", "1735689600123", "1735689600000")]
+
+        with singer.Transformer() as transformer:
+            records = list(transform_records("referrals", names, iter(rows),
+                                             catalog_stream.schema.to_dict(), mdata, transformer))
+
+        self.assertEqual(records, [singer_transform("referrals", dict(zip(names, values)), mdata)
+                                   for values in rows])
+        self.assertEqual(records[0]["dateReferralStarted"], "2025-01-01T00:00:00.000000Z")